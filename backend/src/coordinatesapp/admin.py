@@ -1,7 +1,15 @@
 from django.contrib import admin
-from .models import Location
+from .models import GeocodingJob, Location
 
 
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
-    pass
+    list_display = ["address", "lon", "lat", "fetch_status", "last_fetched"]
+    list_filter = ["fetch_status"]
+    search_fields = ["address"]
+
+
+@admin.register(GeocodingJob)
+class GeocodingJobAdmin(admin.ModelAdmin):
+    list_display = ["address", "created_at", "next_attempt_at", "attempts"]
+    search_fields = ["address"]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+def set_fetch_status(apps, schema_editor):
+    Location = apps.get_model("coordinatesapp", "Location")
+    Location.objects.filter(lon__isnull=False, lat__isnull=False).update(fetch_status="found")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coordinatesapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='fetch_status',
+            field=models.CharField(choices=[('found', 'Найден'), ('not_found', 'Не найден'), ('failed', 'Ошибка геокодера')], default='failed', max_length=10, verbose_name='результат геокодирования'),
+        ),
+        migrations.RunPython(set_fetch_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:16
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coordinatesapp', '0002_location_fetch_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.TextField(unique=True, verbose_name='адрес')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='время постановки в очередь')),
+                ('next_attempt_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='время следующей попытки')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='число попыток')),
+            ],
+            options={
+                'verbose_name': 'задача геокодирования',
+                'verbose_name_plural': 'задачи геокодирования',
+            },
+        ),
+    ]
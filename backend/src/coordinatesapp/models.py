@@ -1,11 +1,56 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
 class Location(models.Model):
+    FETCH_STATUS = [
+        ("found", "Найден"),
+        ("not_found", "Не найден"),
+        ("failed", "Ошибка геокодера"),
+    ]
+
     address = models.TextField(verbose_name="адрес", unique=True)
     lon = models.FloatField(verbose_name="долгота", null=True, blank=True)
     lat = models.FloatField(verbose_name="широта", null=True, blank=True)
     last_fetched = models.DateTimeField(verbose_name="дата проверки координат")
+    fetch_status = models.CharField(
+        verbose_name="результат геокодирования",
+        choices=FETCH_STATUS,
+        max_length=10,
+        default="failed",
+    )
+
+    def __str__(self):
+        return self.address
+
+    def is_expired(self):
+        ttl = settings.GEOCODER_CACHE_TTL[self.fetch_status]
+        return timezone.now() - self.last_fetched > ttl
+
+
+class GeocodingJobQuerySet(models.QuerySet):
+    def enqueue(self, addresses):
+        return self.bulk_create(
+            [GeocodingJob(address=address) for address in set(addresses)],
+            ignore_conflicts=True,
+        )
+
+    def due(self):
+        return self.filter(next_attempt_at__lte=timezone.now()).order_by("next_attempt_at", "id")
+
+
+class GeocodingJob(models.Model):
+    address = models.TextField(verbose_name="адрес", unique=True)
+    created_at = models.DateTimeField(verbose_name="время постановки в очередь", default=timezone.now)
+    next_attempt_at = models.DateTimeField(verbose_name="время следующей попытки", default=timezone.now, db_index=True)
+    attempts = models.PositiveIntegerField(verbose_name="число попыток", default=0)
+
+    objects = GeocodingJobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "задача геокодирования"
+        verbose_name_plural = "задачи геокодирования"
 
     def __str__(self):
         return self.address
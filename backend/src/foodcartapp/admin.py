@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Case, When
 from django.shortcuts import redirect
 from django.shortcuts import reverse
 from django.templatetags.static import static
@@ -6,11 +7,14 @@ from django.utils.encoding import iri_to_uri
 from django.utils.html import format_html
 from django.utils.http import url_has_allowed_host_and_scheme
 
-from .models import Order, OrderContents
+from coordinatesapp.models import GeocodingJob
+from restaurateur.spatial_index import get_nearest_restaurant_ids
+from .models import ArchivedOrder, ArchivedOrderContents, Banner, Order, OrderContents
 from .models import Product
 from .models import ProductCategory
 from .models import Restaurant
 from .models import RestaurantMenuItem
+from .search import get_search_tokens
 
 
 class RestaurantMenuItemInline(admin.TabularInline):
@@ -50,11 +54,10 @@ class ProductAdmin(admin.ModelAdmin):
         'category',
     ]
     search_fields = [
-        # FIXME SQLite can not convert letter case for cyrillic words properly, so search will be buggy.
-        # Migration to PostgreSQL is necessary
         'name',
         'category__name',
     ]
+    search_help_text = 'Название товара или категории'
 
     inlines = [
         RestaurantMenuItemInline
@@ -91,6 +94,20 @@ class ProductAdmin(admin.ModelAdmin):
             )
         }
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        if not get_search_tokens(search_term):
+            # The search index skips words shorter than three letters, the catalog is small enough to scan
+            return super().get_search_results(request, queryset, search_term)
+        # SQLite lowercases only ASCII letters, so names are matched by the search index
+        # and the few categories are compared in Python.
+        categories = [
+            category.id for category in ProductCategory.objects.all()
+            if search_term.lower() in category.name.lower()
+        ]
+        return queryset.search(search_term) | queryset.filter(category__in=categories), False
+
     def get_image_preview(self, obj):
         if not obj.image:
             return 'выберите картинку'
@@ -118,11 +135,28 @@ class OrderContentsInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ["address", "phonenumber", "firstname", "lastname"]
+    list_display = ["address", "phonenumber", "firstname", "lastname", "total_price"]
     inlines = [
         OrderContentsInline
     ]
     raw_id_fields = ["available_restaurants"]
+    readonly_fields = ["total_price"]
+    search_fields = ["firstname", "lastname", "phonenumber", "address"]
+    search_help_text = "Имя, фамилия, телефон или адрес, не короче трёх букв"
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.search(search_term), False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if "address" in form.changed_data:
+            GeocodingJob.objects.enqueue([obj.address])
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.recalculate_total_price()
 
     def response_change(self, request, obj):
         res = super(OrderAdmin, self).response_change(request, obj)
@@ -135,5 +169,57 @@ class OrderAdmin(admin.ModelAdmin):
     def get_form(self, request, obj=None, change=False, **kwargs):
         form = super(OrderAdmin, self).get_form(request, obj, **kwargs)
         if obj:
-            form.base_fields["cooked_by"].queryset = Restaurant.objects.filter(id__in=obj.available_restaurants.all())
+            restaurant_ids = list(obj.available_restaurants.values_list("id", flat=True))
+            nearest_ids = get_nearest_restaurant_ids(obj.address, restaurant_ids)
+            # The nearest restaurant comes first in the list, the ones with unknown distance go last
+            distance_rank = Case(
+                *[When(id=restaurant_id, then=rank) for rank, restaurant_id in enumerate(nearest_ids)],
+                default=len(nearest_ids),
+            )
+            form.base_fields["cooked_by"].queryset = (
+                Restaurant.objects.filter(id__in=restaurant_ids).order_by(distance_rank, "name")
+            )
         return form
+
+
+class ArchivedOrderContentsInline(admin.TabularInline):
+    model = ArchivedOrderContents
+    extra = 0
+    can_delete = False
+    readonly_fields = ["product", "quantity", "cost"]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ["id", "address", "phonenumber", "firstname", "lastname", "total_price", "delivered_at"]
+    list_filter = ["payment_method", "cooked_by"]
+    search_fields = ["=id", "phonenumber", "lastname"]
+    date_hierarchy = "delivered_at"
+    inlines = [
+        ArchivedOrderContentsInline
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Banner)
+class BannerAdmin(admin.ModelAdmin):
+    list_display = ["get_image_list_preview", "title", "position", "active_from", "active_until"]
+    list_display_links = ["title"]
+    list_editable = ["position"]
+
+    def get_image_list_preview(self, obj):
+        if not obj.image:
+            return 'нет картинки'
+        return format_html('<img src="{src}" style="max-height: 50px;"/>', src=obj.image.url)
+    get_image_list_preview.short_description = 'превью'
@@ -0,0 +1,214 @@
+import functools
+import hashlib
+import itertools
+import logging
+import math
+import sqlite3
+import threading
+from time import time
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from .clients import get_client_ip
+from .partners import get_partner_key
+
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+GLOBAL_BUCKET_KEY = "global"
+PRUNE_EVERY = 1000
+
+_local = threading.local()
+_calls = itertools.count(1)
+
+
+def get_admission_store():
+    """Open the token bucket store shared by all worker processes on this host."""
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        connection = sqlite3.connect(
+            settings.ORDER_ADMISSION_STORE_PATH,
+            timeout=settings.ORDER_ADMISSION_STORE_TIMEOUT,
+            isolation_level=None,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(ADMISSION_STORE_SCHEMA)
+        _local.connection = connection
+    return connection
+
+
+def get_client_bucket(request):
+    """Return the bucket key, rate and burst of the client sending the request.
+
+    Partners signed with their key get a bucket of their own sized for batches,
+    everyone else is limited by address.
+    """
+    partner_key = get_partner_key(request)
+    if partner_key:
+        partner_id = hashlib.sha256(partner_key.encode()).hexdigest()[:16]
+        return (
+            f"partner:{partner_id}",
+            settings.ORDER_ADMISSION_PARTNER_RATE,
+            settings.ORDER_ADMISSION_PARTNER_BURST,
+        )
+    return f"ip:{get_client_ip(request)}", settings.ORDER_ADMISSION_IP_RATE, settings.ORDER_ADMISSION_IP_BURST
+
+
+def get_tokens(store, key, rate, burst, now):
+    row = store.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return burst
+    return min(burst, row[0] + (now - row[1]) * rate)
+
+
+def set_tokens(store, key, tokens, now):
+    store.execute(
+        "INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+        (key, tokens, now),
+    )
+
+
+def count_admission_event(store, name):
+    store.execute(
+        "INSERT INTO counters (name, value) VALUES (?, 1) "
+        "ON CONFLICT (name) DO UPDATE SET value = value + 1",
+        (name,),
+    )
+
+
+def admit(client_bucket, cost=1):
+    """Take `cost` tokens from the client's and the global bucket.
+
+    Returns seconds to wait before retrying, or zero if the request is admitted.
+    Tokens are taken from both buckets or from none of them. A bucket with at
+    least one token admits a request of any cost and goes into debt for the rest,
+    so a batch larger than the burst gets through and later requests wait it off.
+    """
+    store = get_admission_store()
+    client_key, client_rate, client_burst = client_bucket
+    client_kind = client_key.split(":", 1)[0]
+    now = time()
+    with store:
+        store.execute("BEGIN IMMEDIATE")
+        client_tokens = get_tokens(store, client_key, client_rate, client_burst, now)
+        if client_tokens < 1:
+            count_admission_event(store, f"shed_{client_kind}")
+            return (1 - client_tokens) / client_rate
+        global_tokens = get_tokens(
+            store,
+            GLOBAL_BUCKET_KEY,
+            settings.ORDER_ADMISSION_RATE,
+            settings.ORDER_ADMISSION_BURST,
+            now,
+        )
+        if global_tokens < 1:
+            count_admission_event(store, "shed_global")
+            return (1 - global_tokens) / settings.ORDER_ADMISSION_RATE
+        set_tokens(store, client_key, client_tokens - cost, now)
+        set_tokens(store, GLOBAL_BUCKET_KEY, global_tokens - cost, now)
+        count_admission_event(store, "admitted")
+    if next(_calls) % PRUNE_EVERY == 0:
+        prune_buckets(store, now)
+    return 0
+
+
+def refund(client_bucket, cost=1):
+    """Give back the tokens taken by a request that turned out to be a replay."""
+    store = get_admission_store()
+    client_key, client_rate, client_burst = client_bucket
+    now = time()
+    with store:
+        store.execute("BEGIN IMMEDIATE")
+        client_tokens = get_tokens(store, client_key, client_rate, client_burst, now)
+        global_tokens = get_tokens(
+            store,
+            GLOBAL_BUCKET_KEY,
+            settings.ORDER_ADMISSION_RATE,
+            settings.ORDER_ADMISSION_BURST,
+            now,
+        )
+        set_tokens(store, client_key, min(client_burst, client_tokens + cost), now)
+        set_tokens(store, GLOBAL_BUCKET_KEY, min(settings.ORDER_ADMISSION_BURST, global_tokens + cost), now)
+        count_admission_event(store, "replayed")
+
+
+def prune_buckets(store, now):
+    """Forget client buckets that have refilled completely."""
+    for kind, rate, burst in [
+        ("ip", settings.ORDER_ADMISSION_IP_RATE, settings.ORDER_ADMISSION_IP_BURST),
+        ("partner", settings.ORDER_ADMISSION_PARTNER_RATE, settings.ORDER_ADMISSION_PARTNER_BURST),
+    ]:
+        store.execute(
+            "DELETE FROM buckets WHERE key LIKE ? AND tokens + (? - updated_at) * ? >= ?",
+            (f"{kind}:%", now, rate, burst),
+        )
+
+
+def get_admission_stats():
+    store = get_admission_store()
+    counters = dict(store.execute("SELECT name, value FROM counters").fetchall())
+    tracked_clients, = store.execute(
+        "SELECT COUNT(*) FROM buckets WHERE key != ?",
+        (GLOBAL_BUCKET_KEY,),
+    ).fetchone()
+    return {
+        "admitted": counters.get("admitted", 0),
+        "shed_ip": counters.get("shed_ip", 0),
+        "shed_partner": counters.get("shed_partner", 0),
+        "shed_global": counters.get("shed_global", 0),
+        "replayed": counters.get("replayed", 0),
+        "tracked_clients": tracked_clients,
+    }
+
+
+def reset_admission_stats():
+    get_admission_store().execute("DELETE FROM counters")
+
+
+def admission_controlled(view=None, *, get_cost=None):
+    """Answer 429 before touching the database when the order API is flooded.
+
+    `get_cost` tells how many orders the request carries; by default it is one.
+    Tokens taken by a request answered with a stored idempotent response are given back.
+    """
+    if view is None:
+        return functools.partial(admission_controlled, get_cost=get_cost)
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.ORDER_ADMISSION_ENABLED or request.method != "POST":
+            return view(request, *args, **kwargs)
+        client_bucket = get_client_bucket(request)
+        cost = get_cost(request) if get_cost else 1
+        try:
+            wait = admit(client_bucket, cost)
+        except sqlite3.OperationalError:
+            logger.exception("Хранилище ограничения нагрузки недоступно, запрос пропущен без проверки")
+            return view(request, *args, **kwargs)
+        if wait:
+            response = JsonResponse({"error": "Слишком много заказов, повторите позже"}, status=429)
+            response["Retry-After"] = str(math.ceil(wait))
+            return response
+
+        response = view(request, *args, **kwargs)
+        if response.get("Idempotent-Replayed") == "true":
+            try:
+                refund(client_bucket, cost)
+            except sqlite3.OperationalError:
+                logger.exception("Хранилище ограничения нагрузки недоступно, токены повтора не возвращены")
+        return response
+    return wrapper
@@ -0,0 +1,56 @@
+from django.db import transaction
+from django.db.models import Q
+
+from .models import ArchivedOrder, ArchivedOrderContents, Order, OrderContents, ORDER_STATUS_RANKS
+
+
+ARCHIVED_ORDER_FIELDS = [
+    "id",
+    "firstname",
+    "lastname",
+    "address",
+    "phonenumber",
+    "status",
+    "payment_method",
+    "comments",
+    "total_price",
+    "cooked_by_id",
+    "created_at",
+    "accepted_at",
+    "delivered_at",
+    "intake_tracking_id",
+]
+
+
+def get_archivable_orders(delivered_before):
+    return Order.objects.filter(status_rank=ORDER_STATUS_RANKS["delivered"]).filter(
+        Q(delivered_at__lt=delivered_before) | Q(delivered_at__isnull=True, created_at__lt=delivered_before)
+    )
+
+
+def archive_orders_batch(delivered_before, batch_size):
+    """Move one batch of delivered orders to the archive tables.
+
+    Copying and deleting happen in one transaction, so an interrupted run
+    leaves every order either in the hot tables or in the archive, and the
+    next run picks up where it stopped.
+    """
+    with transaction.atomic():
+        orders = list(
+            get_archivable_orders(delivered_before)
+            .select_for_update(skip_locked=True)
+            .order_by("id")
+            .values(*ARCHIVED_ORDER_FIELDS)[:batch_size]
+        )
+        if not orders:
+            return 0
+        order_ids = [order["id"] for order in orders]
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders])
+        ArchivedOrderContents.objects.bulk_create([
+            ArchivedOrderContents(**contents)
+            for contents in OrderContents.objects.filter(order__in=order_ids).values(
+                "order_id", "product_id", "quantity", "cost"
+            )
+        ])
+        Order.objects.filter(id__in=order_ids).delete()
+    return len(orders)
@@ -0,0 +1,171 @@
+import time
+import zlib
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from star_burger.db_routers import use_primary
+from .models import Banner, Product, Restaurant, RestaurantMenu, RestaurantMenuItem
+from .renderers import dump_json
+from .snapshots import build_snapshot
+
+
+CATALOG_VERSION_KEY = "catalog:version"
+BANNERS_VERSION_KEY = "banners:version"
+CATALOG_SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    cache.set(key, time.time_ns(), timeout=None)
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def bump_banners_version():
+    bump_version(BANNERS_VERSION_KEY)
+
+
+def dump_product(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'special_status': product.special_status,
+        'description': product.description,
+        'category': {
+            'id': product.category.id,
+            'name': product.category.name,
+        } if product.category else None,
+        'image': product.image.url,
+    }
+
+
+def dump_products():
+    products = Product.objects.select_related('category').available()
+
+    dumped_products = []
+    for product in products:
+        dumped_product = dump_product(product)
+        dumped_product['restaurant'] = {
+            'id': product.id,
+            'name': product.name,
+        }
+        dumped_products.append(dumped_product)
+    return dumped_products
+
+
+def get_catalog_snapshot():
+    """Return the serialized and compressed catalog, building it once per catalog version."""
+    version = get_catalog_version()
+    snapshot_key = f"catalog:snapshot:{version}"
+    snapshot = cache.get(snapshot_key)
+    if snapshot is None:
+        with use_primary():
+            content = dump_json(dump_products())
+        snapshot = build_snapshot("catalog", version, content, last_modified=version // 10 ** 9)
+        cache.set(snapshot_key, snapshot, timeout=CATALOG_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def rebuild_restaurant_menus(restaurant_ids):
+    """Store the current menu of each restaurant as ready-to-send JSON."""
+    restaurant_ids = set(Restaurant.objects.filter(id__in=restaurant_ids).values_list("id", flat=True))
+    menus = {restaurant_id: [] for restaurant_id in restaurant_ids}
+    menu_items = (
+        RestaurantMenuItem.objects
+        .filter(restaurant__in=restaurant_ids, availability=True)
+        .select_related("product__category")
+        .order_by("product__name", "product_id")
+    )
+    for menu_item in menu_items:
+        menus[menu_item.restaurant_id].append(dump_product(menu_item.product))
+
+    version = time.time_ns()
+    RestaurantMenu.objects.bulk_create(
+        [
+            RestaurantMenu(restaurant_id=restaurant_id, content=dump_json(menu).decode(), version=version)
+            for restaurant_id, menu in menus.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["restaurant"],
+        update_fields=["content", "version"],
+    )
+
+
+def get_restaurant_menu_snapshot(restaurant_id):
+    menu = RestaurantMenu.objects.filter(restaurant_id=restaurant_id).values("content", "version").first()
+    if menu is None:
+        # A lagging replica would not have the rebuilt menu yet, so read it back from the primary
+        with use_primary():
+            rebuild_restaurant_menus([restaurant_id])
+            menu = RestaurantMenu.objects.filter(restaurant_id=restaurant_id).values("content", "version").first()
+        if menu is None:
+            return None
+
+    snapshot_key = f"restaurant_menu:snapshot:{restaurant_id}:{menu['version']}"
+    snapshot = cache.get(snapshot_key)
+    if snapshot is None:
+        snapshot = build_snapshot(
+            f"menu-{restaurant_id}",
+            menu["version"],
+            menu["content"].encode(),
+            last_modified=menu["version"] // 10 ** 9,
+        )
+        cache.set(snapshot_key, snapshot, timeout=CATALOG_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def dump_banners(moment):
+    return [{
+        'title': banner.title,
+        'src': banner.image.url,
+        'text': banner.text,
+    } for banner in Banner.objects.active(moment)]
+
+
+def get_banners_snapshot():
+    """Return the serialized active banners and the number of seconds they stay valid.
+
+    The snapshot is rebuilt after a banner edit or when one of the banners
+    enters or leaves its display window.
+    """
+    now = timezone.now()
+    snapshot_key = f"banners:snapshot:{get_version(BANNERS_VERSION_KEY)}"
+    cached = cache.get(snapshot_key)
+    if cached is not None and cached["valid_until"] > now:
+        return cached["snapshot"], (cached["valid_until"] - now).total_seconds()
+
+    content = dump_json(dump_banners(now))
+    snapshot = build_snapshot("banners", zlib.crc32(content), content)
+
+    upcoming_changes = Banner.objects.filter(
+        Q(active_from__gt=now) | Q(active_until__gt=now)
+    ).aggregate(
+        next_start=Min("active_from", filter=Q(active_from__gt=now)),
+        next_end=Min("active_until", filter=Q(active_until__gt=now)),
+    )
+    valid_until = min(
+        [moment for moment in upcoming_changes.values() if moment] + [now + timedelta(days=1)]
+    )
+    cache.set(
+        snapshot_key,
+        {"snapshot": snapshot, "valid_until": valid_until},
+        timeout=(valid_until - now).total_seconds(),
+    )
+    return snapshot, (valid_until - now).total_seconds()
@@ -0,0 +1,8 @@
+from django.conf import settings
+
+
+def get_client_ip(request):
+    header = settings.ORDER_ADMISSION_IP_HEADER
+    if header and request.headers.get(header):
+        return request.headers[header].split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR", "")
@@ -0,0 +1,118 @@
+import functools
+import hashlib
+from time import monotonic, sleep
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .clients import get_client_ip
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_POLL_INTERVAL = 0.1
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def get_scoped_idempotency_key(request):
+    """Return the stored form of the request's Idempotency-Key.
+
+    The same key sent to another endpoint or by another client is a different key.
+    Partners are told apart by their credentials, other clients by their address.
+    """
+    key = request.headers.get("Idempotency-Key")
+    if not key:
+        return None
+    client = request.headers.get("Authorization") or get_client_ip(request)
+    scope = "\n".join([request.path, client, key])
+    return hashlib.sha256(scope.encode()).hexdigest()
+
+
+def get_request_fingerprint(request):
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def claim_idempotency_key(key, fingerprint):
+    now = timezone.now()
+    IdempotencyKey.objects.filter(key=key, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                key=key,
+                request_fingerprint=fingerprint,
+                expires_at=now + settings.IDEMPOTENCY_LOCK_TIMEOUT,
+            )
+    except IntegrityError:
+        return None
+
+
+def get_idempotency_key(key):
+    return IdempotencyKey.objects.filter(key=key, expires_at__gt=timezone.now()).first()
+
+
+def wait_for_idempotent_response(key):
+    deadline = monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    while True:
+        record = get_idempotency_key(key)
+        if record is None or record.is_completed or monotonic() >= deadline:
+            return record
+        sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+
+def idempotent(view=None, *, unless=None):
+    """Replay the stored response for requests repeated with the same Idempotency-Key header.
+
+    A duplicate that arrives while the first request is still running waits
+    for it to finish instead of running the view again. When `unless` returns
+    true for a request, the view keeps track of the key itself.
+    """
+    if view is None:
+        return functools.partial(idempotent, unless=unless)
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if len(request.headers.get("Idempotency-Key", "")) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return JsonResponse({"error": "Слишком длинный ключ идемпотентности"}, status=400)
+        key = get_scoped_idempotency_key(request)
+        if not key or (unless and unless(request)):
+            return view(request, *args, **kwargs)
+
+        fingerprint = get_request_fingerprint(request)
+        record = get_idempotency_key(key)
+        claimed = False
+        if record is None:
+            record = claim_idempotency_key(key, fingerprint)
+            claimed = record is not None
+        if not claimed:
+            if record is None or not record.is_completed:
+                record = wait_for_idempotent_response(key)
+            if record is None or not record.is_completed:
+                return JsonResponse({"error": "Запрос с этим ключом ещё обрабатывается"}, status=409)
+            if record.request_fingerprint != fingerprint:
+                return JsonResponse({"error": "Ключ уже использован для другого запроса"}, status=422)
+            response = HttpResponse(
+                bytes(record.response_body),
+                status=record.response_status,
+                content_type="application/json",
+            )
+            response["Idempotent-Replayed"] = "true"
+            return response
+
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, "render"):
+                response.render()
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+            return response
+
+        record.response_status = response.status_code
+        record.response_body = response.content
+        record.expires_at = timezone.now() + settings.IDEMPOTENCY_KEY_TTL
+        record.save(update_fields=["response_status", "response_body", "expires_at"])
+        return response
+    return wrapper
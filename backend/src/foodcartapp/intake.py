@@ -0,0 +1,176 @@
+import json
+import sqlite3
+import threading
+import uuid
+from time import time
+
+from django.conf import settings
+from django.db import transaction
+
+from coordinatesapp.models import GeocodingJob
+from .models import ArchivedOrder, Order, Product
+from .serializers import OrderSerializer, create_orders, get_ordered_product_ids
+
+
+INTAKE_LOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS intake_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tracking_id TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    accepted_at REAL NOT NULL,
+    order_id INTEGER,
+    errors TEXT,
+    drained_at REAL,
+    idempotency_key TEXT,
+    request_fingerprint TEXT
+);
+CREATE INDEX IF NOT EXISTS intake_log_pending ON intake_log (drained_at, seq);
+"""
+INTAKE_LOG_UPGRADES = {
+    "idempotency_key": "ALTER TABLE intake_log ADD COLUMN idempotency_key TEXT",
+    "request_fingerprint": "ALTER TABLE intake_log ADD COLUMN request_fingerprint TEXT",
+}
+INTAKE_LOG_INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS intake_log_idempotency_key ON intake_log (idempotency_key);
+"""
+
+_local = threading.local()
+
+
+def get_intake_log():
+    """Open the write-behind log for the current thread.
+
+    The log is an SQLite file on the web server's disk in WAL mode, so gunicorn
+    workers append to it concurrently while the drainer reads from it.
+    """
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        connection = sqlite3.connect(
+            settings.ORDER_INTAKE_LOG_PATH,
+            timeout=settings.ORDER_INTAKE_LOG_TIMEOUT,
+            isolation_level=None,
+        )
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=FULL")
+        connection.executescript(INTAKE_LOG_SCHEMA)
+        columns = {row["name"] for row in connection.execute("PRAGMA table_info(intake_log)")}
+        for column, sql in INTAKE_LOG_UPGRADES.items():
+            if column not in columns:
+                connection.execute(sql)
+        connection.executescript(INTAKE_LOG_INDEXES)
+        _local.connection = connection
+    return connection
+
+
+def dump_intake_payload(validated_data):
+    return json.dumps({
+        "firstname": validated_data["firstname"],
+        "lastname": validated_data["lastname"],
+        "phonenumber": str(validated_data["phonenumber"]),
+        "address": validated_data["address"],
+        "products": [
+            {"product": fields["product"].id, "quantity": fields["quantity"]}
+            for fields in validated_data["products"]
+        ],
+    }, ensure_ascii=False)
+
+
+def append_order(validated_data, idempotency_key=None, request_fingerprint=None):
+    """Append the order to the write-behind log and return its tracking id.
+
+    Raises sqlite3.IntegrityError if an order with the same idempotency key is already in the log.
+    """
+    tracking_id = uuid.uuid4()
+    get_intake_log().execute(
+        "INSERT INTO intake_log (tracking_id, payload, accepted_at, idempotency_key, request_fingerprint) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (str(tracking_id), dump_intake_payload(validated_data), time(), idempotency_key, request_fingerprint),
+    )
+    return tracking_id
+
+
+def get_idempotent_intake(idempotency_key):
+    """Return the tracking id and request fingerprint of the order accepted with the idempotency key."""
+    return get_intake_log().execute(
+        "SELECT tracking_id, request_fingerprint FROM intake_log WHERE idempotency_key = ?",
+        (idempotency_key,),
+    ).fetchone()
+
+
+def get_intake_status(tracking_id):
+    row = get_intake_log().execute(
+        "SELECT order_id, errors, drained_at FROM intake_log WHERE tracking_id = ?",
+        (str(tracking_id),),
+    ).fetchone()
+    if row is None:
+        order_id = (
+            Order.objects.filter(intake_tracking_id=tracking_id).values_list("id", flat=True).first()
+            or ArchivedOrder.objects.filter(intake_tracking_id=tracking_id).values_list("id", flat=True).first()
+        )
+        if order_id is None:
+            return None
+        return {"status": "created", "order_id": order_id}
+    if row["drained_at"] is None:
+        return {"status": "pending"}
+    if row["order_id"] is None:
+        return {"status": "rejected", "errors": json.loads(row["errors"])}
+    return {"status": "created", "order_id": row["order_id"]}
+
+
+def drain_intake_log(batch_size):
+    """Move the oldest pending orders from the write-behind log into the database.
+
+    Orders are inserted in the order they were accepted. Each order carries its
+    tracking id, so a batch that was committed to the database but not marked
+    in the log before a crash is recognised on the next run and not inserted twice.
+    Only one drainer must run per log file.
+    """
+    log = get_intake_log()
+    rows = log.execute(
+        "SELECT seq, tracking_id, payload FROM intake_log WHERE drained_at IS NULL ORDER BY seq LIMIT ?",
+        (batch_size,),
+    ).fetchall()
+    if not rows:
+        return 0
+
+    tracking_ids = [uuid.UUID(row["tracking_id"]) for row in rows]
+    order_ids = dict(
+        Order.objects.filter(intake_tracking_id__in=tracking_ids).values_list("intake_tracking_id", "id")
+    )
+    payloads = [json.loads(row["payload"]) for row in rows]
+    available_products = Product.objects.available().in_bulk(get_ordered_product_ids(payloads))
+
+    results = {}
+    validated_orders = []
+    for tracking_id, payload in zip(tracking_ids, payloads):
+        if tracking_id in order_ids:
+            results[tracking_id] = (order_ids[tracking_id], None)
+            continue
+        serializer = OrderSerializer(data=payload, context={"available_products": available_products})
+        if serializer.is_valid():
+            validated_orders.append({**serializer.validated_data, "intake_tracking_id": tracking_id})
+        else:
+            results[tracking_id] = (None, json.dumps(serializer.errors, ensure_ascii=False))
+
+    with transaction.atomic():
+        for order in create_orders(validated_orders):
+            results[order.intake_tracking_id] = (order.id, None)
+        GeocodingJob.objects.enqueue([validated_data["address"] for validated_data in validated_orders])
+
+    drained_at = time()
+    with log:
+        log.execute("BEGIN IMMEDIATE")
+        log.executemany(
+            "UPDATE intake_log SET order_id = ?, errors = ?, drained_at = ? WHERE tracking_id = ?",
+            [(order_id, errors, drained_at, str(tracking_id)) for tracking_id, (order_id, errors) in results.items()],
+        )
+    return len(rows)
+
+
+def prune_intake_log():
+    retention = settings.ORDER_INTAKE_LOG_RETENTION.total_seconds()
+    get_intake_log().execute(
+        "DELETE FROM intake_log WHERE drained_at < ?",
+        (time() - retention,),
+    )
@@ -0,0 +1,37 @@
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Banner
+
+
+DEFAULT_BANNERS = [
+    ('Burger', 'burger.jpg', 'Tasty Burger at your door step'),
+    ('Spices', 'food.jpg', 'All Cuisines'),
+    ('New York', 'tasty.jpg', 'Food is incomplete without a tasty dessert'),
+]
+
+
+class Command(BaseCommand):
+    help = "Добавляет стандартные баннеры, если в базе ещё нет ни одного баннера"
+
+    def handle(self, *args, **options):
+        if Banner.objects.exists():
+            self.stdout.write("Баннеры уже есть, ничего не добавлено")
+            return
+        added = 0
+        for position, (title, filename, text) in enumerate(DEFAULT_BANNERS):
+            path = os.path.join(settings.BASE_DIR, "assets", filename)
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as image:
+                Banner.objects.create(
+                    title=title,
+                    text=text,
+                    position=position,
+                    image=File(image, name=filename),
+                )
+            added += 1
+        self.stdout.write(self.style.SUCCESS(f"Добавлено баннеров: {added}"))
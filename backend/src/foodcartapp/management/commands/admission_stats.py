@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.admission import get_admission_stats, reset_admission_stats
+
+
+class Command(BaseCommand):
+    help = "Показывает, сколько заказов пропущено и отклонено ограничением нагрузки"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Обнулить счётчики после вывода")
+
+    def handle(self, *args, reset, **options):
+        stats = get_admission_stats()
+        self.stdout.write(f"Пропущено: {stats['admitted']}")
+        self.stdout.write(f"Отклонено по лимиту адреса: {stats['shed_ip']}")
+        self.stdout.write(f"Отклонено по лимиту партнёра: {stats['shed_partner']}")
+        self.stdout.write(f"Отклонено по общему лимиту: {stats['shed_global']}")
+        self.stdout.write(f"Повторов без списания токенов: {stats['replayed']}")
+        self.stdout.write(f"Отслеживаемых клиентов: {stats['tracked_clients']}")
+        if reset:
+            reset_admission_stats()
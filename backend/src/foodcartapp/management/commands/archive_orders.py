@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodcartapp.archive import archive_orders_batch
+
+
+class Command(BaseCommand):
+    help = "Переносит доставленные заказы старше заданного срока в архив"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="Архивировать заказы, доставленные раньше, дней назад")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--max-batches", type=int, default=None, help="Остановиться после стольких партий")
+
+    def handle(self, *args, days, batch_size, max_batches, **options):
+        delivered_before = timezone.now() - timedelta(days=days)
+        archived = batches = 0
+        while max_batches is None or batches < max_batches:
+            moved = archive_orders_batch(delivered_before, batch_size)
+            if not moved:
+                break
+            archived += moved
+            batches += 1
+            self.stdout.write(f"Перенесено в архив: {archived}")
+        self.stdout.write(f"Архивация завершена, всего перенесено заказов: {archived}")
@@ -0,0 +1,254 @@
+import json
+import random
+import re
+from datetime import timedelta
+from statistics import median
+from time import perf_counter
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.utils import timezone
+
+from coordinatesapp.models import GeocodingJob
+from foodcartapp.archive import get_archivable_orders
+from foodcartapp.models import (
+    ORDER_STATUS_RANKS,
+    ArchivedOrder,
+    IdempotencyKey,
+    Order,
+    OrderContents,
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+)
+
+
+CATALOG_TABLES = {
+    "foodcartapp_product",
+    "foodcartapp_productcategory",
+    "foodcartapp_restaurant",
+}
+SQLITE_SCAN = re.compile(r"^SCAN (\w+)\b(?! USING| VIRTUAL TABLE)")
+SUBQUERY_ALIAS = re.compile(r'"(\w+)" (U\d+)\b')
+
+
+def get_admin_changelist_queryset(model, user):
+    request = RequestFactory().get("/admin/")
+    request.user = user
+    changelist = admin.site._registry[model].get_changelist_instance(request)
+    return changelist.get_queryset(request)[:changelist.list_per_page]
+
+
+def get_hot_querysets(user):
+    now = timezone.now()
+    order_ids = list(Order.objects.order_by("-id").values_list("id", flat=True)[:100])
+    product_ids = list(Product.objects.values_list("id", flat=True)[:20])
+    restaurant = Restaurant.objects.order_by("-id").first()
+    open_orders = Order.objects.open()
+    return {
+        "доступные товары": Product.objects.available(),
+        "страница заказов": open_orders.ordered_by_status_and_id()[:51],
+        "заказы по способу оплаты": open_orders.filter(payment_method="online").ordered_by_status_and_id()[:51],
+        "заказы ресторана": open_orders.filter(cooked_by=restaurant).ordered_by_status_and_id()[:51],
+        "заказы по сумме": open_orders.filter(total_price__gte=5000).ordered_by_status_and_id()[:51],
+        "лента изменений": (
+            Order.objects.changed_after(now - timedelta(minutes=5), 0)
+            .filter(updated_at__lte=now).order_by("updated_at", "id")[:100]
+        ),
+        "поиск заказов": open_orders.search("Тверская 929").ordered_by_status_and_id()[:51],
+        "состав заказов": OrderContents.objects.filter(order__in=order_ids).values_list("order", "product"),
+        "меню для заказов": RestaurantMenuItem.objects.filter(
+            availability=True,
+            product__in=product_ids,
+        ).values_list("restaurant", "product"),
+        "заказы для архивации": get_archivable_orders(now - timedelta(days=30)).order_by("id")[:500],
+        "задачи геокодирования": GeocodingJob.objects.due()[:50],
+        "ключ идемпотентности": IdempotencyKey.objects.filter(key="audit", expires_at__gt=now),
+        "админка заказов": get_admin_changelist_queryset(Order, user),
+        "админка архива": get_admin_changelist_queryset(ArchivedOrder, user),
+        "админка товаров": get_admin_changelist_queryset(Product, user),
+    }
+
+
+def find_postgres_seq_scans(plan):
+    scans = set()
+    if plan.get("Node Type") == "Seq Scan":
+        scans.add(plan["Relation Name"])
+    for subplan in plan.get("Plans", []):
+        scans |= find_postgres_seq_scans(subplan)
+    return scans
+
+
+def explain_postgres(queryset):
+    explained, = json.loads(queryset.explain(format="json", analyze=True))
+    return {
+        "plan": queryset.explain(),
+        "seq_scans": find_postgres_seq_scans(explained["Plan"]),
+        "estimated_rows": explained["Plan"]["Plan Rows"],
+        "rows": explained["Plan"]["Actual Rows"],
+        "time_ms": explained["Execution Time"],
+    }
+
+
+def is_primary_key_walk(queryset):
+    """Tell whether the query reads the first rows of the table in primary key order.
+
+    SQLite reports such a query as SCAN, but it stops after LIMIT rows.
+    """
+    query = queryset.query
+    return (
+        query.high_mark is not None
+        and not query.where
+        and bool(query.order_by)
+        and query.order_by[0].lstrip("-") in ("pk", queryset.model._meta.pk.name)
+    )
+
+
+def find_sqlite_seq_scans(queryset, plan):
+    aliases = dict((alias, table) for table, alias in SUBQUERY_ALIAS.findall(str(queryset.query)))
+    scans = set()
+    for line in plan.splitlines():
+        match = SQLITE_SCAN.match(line.split(" ", 3)[-1])
+        if match:
+            scans.add(aliases.get(match[1], match[1]))
+    if is_primary_key_walk(queryset):
+        scans.discard(queryset.model._meta.db_table)
+    return scans
+
+
+def explain_sqlite(queryset, repeat=5):
+    plan = queryset.explain()
+    timings = []
+    for _ in range(repeat):
+        started_at = perf_counter()
+        rows = len(list(queryset.all()))
+        timings.append((perf_counter() - started_at) * 1000)
+    return {
+        "plan": plan,
+        "seq_scans": find_sqlite_seq_scans(queryset, plan),
+        "estimated_rows": None,
+        "rows": rows,
+        "time_ms": median(timings),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверяет планы горячих запросов на тестовых данных во временной базе "
+        "и падает, если запрос читает таблицу целиком"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=20000, help="Сколько заказов создать для проверки")
+        parser.add_argument("--max-ms", type=float, default=None, help="Считать регрессией запросы медленнее, мс")
+        parser.add_argument("--verbose-plans", action="store_true", help="Печатать планы целиком")
+
+    def handle(self, *args, orders, max_ms, verbose_plans, **options):
+        if connection.vendor not in ("postgresql", "sqlite"):
+            raise CommandError(f"Проверка планов не поддерживается для {connection.vendor}")
+
+        # Seed a throwaway database, so the live one keeps its sequences, statistics and locks
+        live_database_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.seed(orders)
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+                if connection.vendor == "postgresql":
+                    # With sequential scans priced out, a Seq Scan in the plan means no usable index exists.
+                    cursor.execute("SET enable_seqscan = off")
+            user = User(is_active=True, is_staff=True, is_superuser=True)
+            regressions = []
+            for name, queryset in get_hot_querysets(user).items():
+                regressions += self.audit(name, queryset, max_ms, verbose_plans)
+        finally:
+            connection.creation.destroy_test_db(live_database_name, verbosity=0)
+
+        if regressions:
+            raise CommandError("Регрессии планов запросов:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Все горячие запросы используют индексы"))
+
+    def audit(self, name, queryset, max_ms, verbose_plans):
+        if connection.vendor == "postgresql":
+            report = explain_postgres(queryset)
+        else:
+            report = explain_sqlite(queryset)
+
+        seq_scans = report["seq_scans"] - CATALOG_TABLES
+        estimated = "" if report["estimated_rows"] is None else f", оценка {report['estimated_rows']}"
+        self.stdout.write(
+            f"{name}: {report['time_ms']:.2f} мс, строк {report['rows']}{estimated}"
+            + (f", полное чтение: {', '.join(sorted(seq_scans))}" if seq_scans else "")
+        )
+        if verbose_plans or seq_scans:
+            self.stdout.write(report["plan"])
+
+        regressions = []
+        if seq_scans:
+            regressions.append(f"{name}: полное чтение {', '.join(sorted(seq_scans))}")
+        if max_ms is not None and report["time_ms"] > max_ms:
+            regressions.append(f"{name}: {report['time_ms']:.2f} мс дольше {max_ms} мс")
+        return regressions
+
+    def seed(self, orders_count):
+        now = timezone.now()
+        category = ProductCategory.objects.create(name="Проверка планов")
+        restaurants = Restaurant.objects.bulk_create([
+            Restaurant(name=f"Ресторан {number}", address=f"Москва, Проверочная {number}")
+            for number in range(20)
+        ])
+        products = Product.objects.bulk_create([
+            Product(name=f"Бургер {number}", category=category, price=100 + number, image="audit.jpg")
+            for number in range(200)
+        ])
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=restaurant, product=product, availability=random.random() < 0.8)
+            for restaurant in restaurants for product in products
+        ])
+
+        statuses = list(ORDER_STATUS_RANKS.items())
+        new_orders = []
+        for number in range(orders_count):
+            status, status_rank = random.choices(statuses, weights=[3, 3, 3, 91])[0]
+            created_at = now - timedelta(minutes=number)
+            new_orders.append(Order(
+                firstname=f"Клиент {number}",
+                lastname=f"Проверкин {number}",
+                phonenumber=f"+7929{number:07d}",
+                address=f"Москва, Тверская {number % 500}",
+                status=status,
+                status_rank=status_rank,
+                payment_method=random.choice(["cash", "online"]),
+                cooked_by=random.choice(restaurants),
+                total_price=random.randint(100, 10000),
+                created_at=created_at,
+                delivered_at=created_at + timedelta(hours=1) if status == "delivered" else None,
+            ))
+        seeded_orders = Order.objects.bulk_create(new_orders, batch_size=1000)
+        OrderContents.objects.bulk_create([
+            OrderContents(order=order, product=product, quantity=1, cost=product.price)
+            for order in seeded_orders for product in random.sample(products, 2)
+        ], batch_size=1000)
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(
+                id=order.id + 10 ** 9,
+                firstname=order.firstname,
+                lastname=order.lastname,
+                address=order.address,
+                phonenumber=order.phonenumber,
+                status="delivered",
+                payment_method=order.payment_method,
+                total_price=order.total_price,
+                created_at=order.created_at,
+                delivered_at=order.created_at,
+            )
+            for order in seeded_orders
+        ], batch_size=1000)
+        GeocodingJob.objects.bulk_create([
+            GeocodingJob(address=f"Москва, Проверочная {number}", next_attempt_at=now + timedelta(seconds=number))
+            for number in range(orders_count // 10)
+        ], batch_size=1000)
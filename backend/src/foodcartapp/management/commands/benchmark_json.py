@@ -0,0 +1,45 @@
+import json
+from decimal import Decimal
+from timeit import timeit
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from foodcartapp.renderers import dump_json
+
+
+class Command(BaseCommand):
+    help = "Сравнивает скорость сериализации каталога через json и через быстрый рендерер"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, products, repeat, **options):
+        catalog = [{
+            'id': product_id,
+            'name': f'Чизбургер №{product_id}',
+            'price': Decimal('199.00') + product_id,
+            'special_status': product_id % 10 == 0,
+            'description': 'Сочная котлета из говядины, сыр чеддер, маринованные огурцы и фирменный соус',
+            'category': {
+                'id': product_id % 7,
+                'name': 'Бургеры',
+            },
+            'image': f'/media/burger_{product_id}.jpg',
+            'restaurant': {
+                'id': product_id,
+                'name': f'Чизбургер №{product_id}',
+            }
+        } for product_id in range(products)]
+
+        renderers = {
+            "json, indent=4": lambda: json.dumps(
+                catalog, cls=DjangoJSONEncoder, ensure_ascii=False, indent=4
+            ).encode(),
+            "dump_json": lambda: dump_json(catalog),
+            "dump_json, pretty": lambda: dump_json(catalog, pretty=True),
+        }
+        for name, render in renderers.items():
+            elapsed = timeit(render, number=repeat) / repeat
+            self.stdout.write(f"{name:>20}: {elapsed * 1000:8.2f} мс, {len(render()) / 1024:8.1f} КБ")
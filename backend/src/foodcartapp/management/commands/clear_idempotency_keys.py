@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodcartapp.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Удаляет просроченные ключи идемпотентности"
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+        self.stdout.write(f"Удалено ключей: {deleted}")
@@ -0,0 +1,25 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.intake import drain_intake_log, prune_intake_log
+
+
+class Command(BaseCommand):
+    help = "Переносит заказы из локального журнала приёма в базу данных"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--loop", action="store_true", help="Не завершаться, ожидая новые заказы")
+        parser.add_argument("--interval", type=float, default=0.5, help="Пауза между проверками журнала, с")
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        prune_intake_log()
+        while True:
+            drained = drain_intake_log(batch_size)
+            if drained:
+                self.stdout.write(f"Перенесено заказов: {drained}")
+            elif not loop:
+                return
+            else:
+                sleep(interval)
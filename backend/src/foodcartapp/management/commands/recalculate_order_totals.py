@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = "Проверяет и пересчитывает сохранённые суммы заказов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Только проверить, ничего не исправляя")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, check, batch_size, **options):
+        wrong_order_ids = list(Order.objects.with_wrong_total_price().values_list("id", flat=True))
+        if check:
+            if wrong_order_ids:
+                raise CommandError(f"Неверная сумма у заказов: {len(wrong_order_ids)}, например {wrong_order_ids[:10]}")
+            self.stdout.write("Суммы всех заказов верны")
+            return
+
+        for start in range(0, len(wrong_order_ids), batch_size):
+            Order.objects.filter(id__in=wrong_order_ids[start:start + batch_size]).recalculate_total_price()
+        self.stdout.write(f"Пересчитано заказов: {len(wrong_order_ids)}")
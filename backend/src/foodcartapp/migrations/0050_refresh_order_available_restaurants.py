@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def refresh_available_restaurants(apps, schema_editor):
+    Order = apps.get_model("foodcartapp", "Order")
+    RestaurantMenuItem = apps.get_model("foodcartapp", "RestaurantMenuItem")
+
+    menus = {}
+    for restaurant_id, product_id in RestaurantMenuItem.objects.filter(availability=True).values_list(
+        "restaurant", "product"
+    ):
+        menus.setdefault(restaurant_id, set()).add(product_id)
+
+    for order in Order.objects.exclude(status="delivered").prefetch_related("contents"):
+        products = {content.product_id for content in order.contents.all()}
+        order.available_restaurants.set([
+            restaurant_id for restaurant_id, menu in menus.items() if products and products <= menu
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0049_alter_ordercontents_product'),
+    ]
+
+    operations = [
+        migrations.RunPython(refresh_available_restaurants, migrations.RunPython.noop),
+    ]
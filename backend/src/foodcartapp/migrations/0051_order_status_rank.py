@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:18
+
+from django.db import migrations, models
+
+
+STATUS_RANKS = {
+    "created": 1,
+    "accepted": 2,
+    "packed": 3,
+    "delivered": 4,
+}
+
+
+def set_status_rank(apps, schema_editor):
+    Order = apps.get_model("foodcartapp", "Order")
+    for status, rank in STATUS_RANKS.items():
+        Order.objects.filter(status=status).update(status_rank=rank)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0050_refresh_order_available_restaurants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='status_rank',
+            field=models.PositiveSmallIntegerField(default=1, editable=False, verbose_name='порядок статуса'),
+        ),
+        migrations.RunPython(set_status_rank, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status_rank', 'id'], name='foodcartapp_status__0e2594_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['payment_method', 'status_rank', 'id'], name='foodcartapp_payment_fc4ed0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['cooked_by', 'status_rank', 'id'], name='foodcartapp_cooked__dd5fec_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0052_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantMenu',
+            fields=[
+                ('restaurant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='menu', serialize=False, to='foodcartapp.restaurant', verbose_name='ресторан')),
+                ('content', models.TextField(verbose_name='меню в формате JSON')),
+                ('version', models.BigIntegerField(verbose_name='версия')),
+            ],
+            options={
+                'verbose_name': 'опубликованное меню ресторана',
+                'verbose_name_plural': 'опубликованные меню ресторанов',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:23
+
+from django.db import migrations, models
+import foodcartapp.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0053_restaurantmenu'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Banner',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100, verbose_name='заголовок')),
+                ('text', models.CharField(blank=True, max_length=200, verbose_name='текст')),
+                ('image', models.ImageField(upload_to=foodcartapp.models.get_banner_image_path, verbose_name='картинка')),
+                ('position', models.PositiveIntegerField(db_index=True, default=0, verbose_name='порядок')),
+                ('active_from', models.DateTimeField(blank=True, null=True, verbose_name='показывать с')),
+                ('active_until', models.DateTimeField(blank=True, null=True, verbose_name='показывать до')),
+            ],
+            options={
+                'verbose_name': 'баннер',
+                'verbose_name_plural': 'баннеры',
+                'ordering': ['position', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,12 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Default banners used to be copied to MEDIA_ROOT here, which also happened
+    # for every test database. They are added by the add_default_banners command now.
+
+    dependencies = [
+        ('foodcartapp', '0054_banner'),
+    ]
+
+    operations = []
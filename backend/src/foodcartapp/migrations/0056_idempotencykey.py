@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:24
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0055_add_default_banners'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='ключ')),
+                ('request_fingerprint', models.CharField(max_length=64, verbose_name='отпечаток запроса')),
+                ('response_status', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='код ответа')),
+                ('response_body', models.BinaryField(blank=True, default=b'', verbose_name='тело ответа')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='время создания')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='действует до')),
+            ],
+            options={
+                'verbose_name': 'ключ идемпотентности',
+                'verbose_name_plural': 'ключи идемпотентности',
+            },
+        ),
+    ]
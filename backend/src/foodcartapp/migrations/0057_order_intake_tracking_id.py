@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0056_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='intake_tracking_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True, verbose_name='номер отслеживания'),
+        ),
+    ]
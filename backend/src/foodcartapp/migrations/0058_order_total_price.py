@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:29
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def set_total_price(apps, schema_editor):
+    Order = apps.get_model("foodcartapp", "Order")
+    OrderContents = apps.get_model("foodcartapp", "OrderContents")
+    contents_total = (
+        OrderContents.objects
+        .filter(order=OuterRef("pk"))
+        .values("order")
+        .annotate(total=Sum(F("cost") * F("quantity"), output_field=models.DecimalField()))
+        .values("total")
+    )
+    Order.objects.update(
+        total_price=Coalesce(Subquery(contents_total), Value(0), output_field=models.DecimalField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0057_order_intake_tracking_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='сумма заказа'),
+        ),
+        migrations.RunPython(set_total_price, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total_price', 'id'], name='foodcartapp_total_p_1b58cf_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import phonenumber_field.modelfields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0058_order_total_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='номер заказа')),
+                ('firstname', models.CharField(max_length=100, verbose_name='имя')),
+                ('lastname', models.CharField(max_length=100, verbose_name='фамилия')),
+                ('address', models.TextField(verbose_name='адрес доставки')),
+                ('phonenumber', phonenumber_field.modelfields.PhoneNumberField(db_index=True, max_length=128, region=None, verbose_name='номер телефона')),
+                ('status', models.CharField(choices=[('created', 'Создан'), ('accepted', 'Принят'), ('packed', 'Собран'), ('delivered', 'Доставлен')], max_length=20, verbose_name='статус заказа')),
+                ('payment_method', models.CharField(choices=[('cash', 'Наличными'), ('online', 'Электронно')], max_length=12, verbose_name='способ оплаты')),
+                ('comments', models.TextField(blank=True, verbose_name='комментарии')),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='сумма заказа')),
+                ('created_at', models.DateTimeField(db_index=True, verbose_name='время создания')),
+                ('accepted_at', models.DateTimeField(blank=True, null=True, verbose_name='время звонка')),
+                ('delivered_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='время доставки')),
+                ('intake_tracking_id', models.UUIDField(blank=True, null=True, unique=True, verbose_name='номер отслеживания')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='время архивации')),
+                ('cooked_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_orders', to='foodcartapp.restaurant', verbose_name='готовивший ресторан')),
+            ],
+            options={
+                'verbose_name': 'архивный заказ',
+                'verbose_name_plural': 'архивные заказы',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderContents',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(verbose_name='количество')),
+                ('cost', models.DecimalField(decimal_places=2, max_digits=7, verbose_name='стоимость позиции')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contents', to='foodcartapp.archivedorder', verbose_name='заказ')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='foodcartapp.product', verbose_name='товар')),
+            ],
+            options={
+                'verbose_name': 'позиция архивного заказа',
+                'verbose_name_plural': 'позиции архивных заказов',
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0060_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='restaurantmenuitem',
+            index=models.Index(condition=models.Q(('availability', True)), fields=['product', 'restaurant'], name='menu_item_available_idx'),
+        ),
+    ]
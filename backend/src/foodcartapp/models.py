@@ -1,25 +1,107 @@
+import hashlib
+import os
+
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import Sum, F
+from django.db.models import Exists, Sum, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from phonenumber_field.modelfields import PhoneNumberField
 from django.utils import timezone
 
+from .search import search
+
+
+ORDER_STATUS_RANKS = {
+    "created": 1,
+    "accepted": 2,
+    "packed": 3,
+    "delivered": 4,
+}
+
+
+def get_contents_total_price():
+    contents_total = (
+        OrderContents.objects
+        .filter(order=OuterRef("pk"))
+        .values("order")
+        .annotate(total=Sum(F("cost") * F("quantity"), output_field=models.DecimalField()))
+        .values("total")
+    )
+    return Coalesce(Subquery(contents_total), Value(0), output_field=models.DecimalField())
+
 
 class OrderQuerySet(models.QuerySet):
-    def with_total_price(self):
-        return self.annotate(
-            total_price=Sum(F("contents__cost") * F("contents__quantity"), output_field=models.DecimalField())
-        )
+    def open(self):
+        return self.filter(status_rank__lt=ORDER_STATUS_RANKS["delivered"])
+
+    def refresh_available_restaurants(self):
+        order_ids = list(self.values_list("id", flat=True))
+        orders_products = {order_id: set() for order_id in order_ids}
+        for order_id, product_id in OrderContents.objects.filter(order__in=order_ids).values_list("order", "product"):
+            orders_products[order_id].add(product_id)
+
+        ordered_products = set().union(*orders_products.values())
+        menus = {}
+        for restaurant_id, product_id in RestaurantMenuItem.objects.filter(
+            availability=True,
+            product__in=ordered_products,
+        ).values_list("restaurant", "product"):
+            menus.setdefault(restaurant_id, set()).add(product_id)
+
+        AvailableRestaurant = Order.available_restaurants.through
+        current_restaurants = {order_id: set() for order_id in order_ids}
+        link_ids = {}
+        for link_id, order_id, restaurant_id in AvailableRestaurant.objects.filter(
+            order__in=order_ids
+        ).values_list("id", "order", "restaurant"):
+            current_restaurants[order_id].add(restaurant_id)
+            link_ids[order_id, restaurant_id] = link_id
+
+        new_links = []
+        stale_link_ids = []
+        changed_orders = set()
+        for order_id, products in orders_products.items():
+            restaurants = {
+                restaurant_id for restaurant_id, menu in menus.items() if products and products <= menu
+            }
+            if restaurants == current_restaurants[order_id]:
+                continue
+            changed_orders.add(order_id)
+            for restaurant_id in restaurants - current_restaurants[order_id]:
+                new_links.append(AvailableRestaurant(order_id=order_id, restaurant_id=restaurant_id))
+            for restaurant_id in current_restaurants[order_id] - restaurants:
+                stale_link_ids.append(link_ids[order_id, restaurant_id])
+
+        if stale_link_ids:
+            AvailableRestaurant.objects.filter(id__in=stale_link_ids).delete()
+        AvailableRestaurant.objects.bulk_create(new_links)
+        if changed_orders:
+            Order.objects.filter(id__in=changed_orders).update(updated_at=timezone.now())
+
+    def with_calculated_total_price(self):
+        return self.annotate(calculated_total_price=get_contents_total_price())
+
+    def recalculate_total_price(self):
+        return self.update(total_price=get_contents_total_price())
+
+    def with_wrong_total_price(self):
+        return self.with_calculated_total_price().exclude(total_price=F("calculated_total_price"))
 
     def ordered_by_status_and_id(self):
-        return self.annotate(
-            status_order=models.Case(
-                models.When(status="created", then=1),
-                models.When(status="accepted", then=2),
-                models.When(status="packed", then=3),
-                models.When(status="delivered", then=4)
-            )
-        ).order_by("status_order", "id")
+        return self.order_by("status_rank", "id")
+
+    def changed_after(self, updated_at, order_id):
+        return self.filter(
+            Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=order_id)
+        )
+
+    def after(self, status_rank, order_id):
+        return self.filter(
+            Q(status_rank__gt=status_rank) | Q(status_rank=status_rank, id__gt=order_id)
+        )
+
+    def search(self, query):
+        return search(self, query)
 
 
 class Restaurant(models.Model):
@@ -48,12 +130,11 @@ class Restaurant(models.Model):
 
 class ProductQuerySet(models.QuerySet):
     def available(self):
-        products = (
-            RestaurantMenuItem.objects
-            .filter(availability=True)
-            .values_list('product')
-        )
-        return self.filter(pk__in=products)
+        menu_items = RestaurantMenuItem.objects.filter(product=OuterRef('pk'), availability=True)
+        return self.filter(Exists(menu_items))
+
+    def search(self, query):
+        return search(self, query)
 
 
 class ProductCategory(models.Model):
@@ -138,11 +219,72 @@ class RestaurantMenuItem(models.Model):
         unique_together = [
             ['restaurant', 'product']
         ]
+        indexes = [
+            models.Index(
+                fields=['product', 'restaurant'],
+                condition=Q(availability=True),
+                name='menu_item_available_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.restaurant.name} - {self.product.name}"
 
 
+class RestaurantMenu(models.Model):
+    restaurant = models.OneToOneField(
+        Restaurant,
+        verbose_name="ресторан",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="menu",
+    )
+    content = models.TextField(verbose_name="меню в формате JSON")
+    version = models.BigIntegerField(verbose_name="версия")
+
+    class Meta:
+        verbose_name = "опубликованное меню ресторана"
+        verbose_name_plural = "опубликованные меню ресторанов"
+
+    def __str__(self):
+        return f"{self.restaurant_id} - {self.version}"
+
+
+def get_banner_image_path(instance, filename):
+    digest = hashlib.sha256()
+    for chunk in instance.image.chunks():
+        digest.update(chunk)
+    _, extension = os.path.splitext(filename)
+    return f"banners/{digest.hexdigest()[:20]}{extension.lower()}"
+
+
+class BannerQuerySet(models.QuerySet):
+    def active(self, moment):
+        return self.filter(
+            models.Q(active_from__isnull=True) | models.Q(active_from__lte=moment),
+            models.Q(active_until__isnull=True) | models.Q(active_until__gt=moment),
+        )
+
+
+class Banner(models.Model):
+    title = models.CharField("заголовок", max_length=100)
+    text = models.CharField("текст", max_length=200, blank=True)
+    image = models.ImageField("картинка", upload_to=get_banner_image_path)
+    position = models.PositiveIntegerField("порядок", default=0, db_index=True)
+    active_from = models.DateTimeField("показывать с", null=True, blank=True)
+    active_until = models.DateTimeField("показывать до", null=True, blank=True)
+
+    objects = BannerQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "баннер"
+        verbose_name_plural = "баннеры"
+        ordering = ["position", "id"]
+
+    def __str__(self):
+        return self.title
+
+
 class Order(models.Model):
     ORDER_STATUS = [
         ("created", "Создан"),
@@ -168,6 +310,11 @@ class Order(models.Model):
         default="created",
         db_index=True
     )
+    status_rank = models.PositiveSmallIntegerField(
+        verbose_name="порядок статуса",
+        default=ORDER_STATUS_RANKS["created"],
+        editable=False,
+    )
     payment_method = models.CharField(
         verbose_name="способ оплаты",
         choices=PAYMENT_METHODS,
@@ -176,6 +323,13 @@ class Order(models.Model):
         db_index=True
     )
     comments = models.TextField(verbose_name="комментарии", blank=True)
+    total_price = models.DecimalField(
+        verbose_name="сумма заказа",
+        decimal_places=2,
+        max_digits=10,
+        default=0,
+        editable=False,
+    )
 
     available_restaurants = models.ManyToManyField(
         Restaurant,
@@ -193,20 +347,47 @@ class Order(models.Model):
     )
 
     created_at = models.DateTimeField(verbose_name="время создания", default=timezone.now, db_index=True)
+    updated_at = models.DateTimeField(verbose_name="время изменения", auto_now=True)
     accepted_at = models.DateTimeField(verbose_name="время звонка", blank=True, null=True, db_index=True)
     delivered_at = models.DateTimeField(verbose_name="время доставки", blank=True, null=True, db_index=True)
+    intake_tracking_id = models.UUIDField(
+        verbose_name="номер отслеживания",
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = "заказ"
         verbose_name_plural = "заказы"
         indexes = [
             models.Index(fields=["lastname", "firstname"]),
-            models.Index(fields=["phonenumber"])
+            models.Index(fields=["phonenumber"]),
+            models.Index(fields=["status_rank", "id"]),
+            models.Index(fields=["payment_method", "status_rank", "id"]),
+            models.Index(fields=["cooked_by", "status_rank", "id"]),
+            models.Index(fields=["updated_at", "id"]),
+            models.Index(fields=["total_price", "id"]),
         ]
 
     def __str__(self):
         return f"{self.lastname} - {self.phonenumber}"
 
+    def save(self, *args, **kwargs):
+        self.status_rank = ORDER_STATUS_RANKS[self.status]
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "status" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "status_rank"}
+        super().save(*args, **kwargs)
+
+    def refresh_available_restaurants(self):
+        Order.objects.filter(pk=self.pk).refresh_available_restaurants()
+
+    def recalculate_total_price(self):
+        Order.objects.filter(pk=self.pk).recalculate_total_price()
+        self.refresh_from_db(fields=["total_price"])
+
 
 class OrderContents(models.Model):
     order = models.ForeignKey(Order, verbose_name="заказ", on_delete=models.CASCADE, related_name="contents")
@@ -222,3 +403,78 @@ class OrderContents(models.Model):
     def __str__(self):
         return f"{self.order} - {self.product}"
 
+
+class ArchivedOrder(models.Model):
+    id = models.IntegerField(verbose_name="номер заказа", primary_key=True)
+    firstname = models.CharField(verbose_name="имя", max_length=100)
+    lastname = models.CharField(verbose_name="фамилия", max_length=100)
+    address = models.TextField(verbose_name="адрес доставки")
+    phonenumber = PhoneNumberField(verbose_name="номер телефона", db_index=True)
+    status = models.CharField(verbose_name="статус заказа", choices=Order.ORDER_STATUS, max_length=20)
+    payment_method = models.CharField(verbose_name="способ оплаты", choices=Order.PAYMENT_METHODS, max_length=12)
+    comments = models.TextField(verbose_name="комментарии", blank=True)
+    total_price = models.DecimalField(verbose_name="сумма заказа", decimal_places=2, max_digits=10)
+    cooked_by = models.ForeignKey(
+        Restaurant,
+        verbose_name="готовивший ресторан",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="archived_orders"
+    )
+    created_at = models.DateTimeField(verbose_name="время создания", db_index=True)
+    accepted_at = models.DateTimeField(verbose_name="время звонка", blank=True, null=True)
+    delivered_at = models.DateTimeField(verbose_name="время доставки", blank=True, null=True, db_index=True)
+    intake_tracking_id = models.UUIDField(verbose_name="номер отслеживания", unique=True, null=True, blank=True)
+    archived_at = models.DateTimeField(verbose_name="время архивации", default=timezone.now)
+
+    class Meta:
+        verbose_name = "архивный заказ"
+        verbose_name_plural = "архивные заказы"
+
+    def __str__(self):
+        return f"{self.lastname} - {self.phonenumber}"
+
+
+class ArchivedOrderContents(models.Model):
+    order = models.ForeignKey(
+        ArchivedOrder,
+        verbose_name="заказ",
+        on_delete=models.CASCADE,
+        related_name="contents"
+    )
+    product = models.ForeignKey(
+        Product,
+        verbose_name="товар",
+        on_delete=models.CASCADE,
+        related_name="archived_orders"
+    )
+    quantity = models.IntegerField(verbose_name="количество")
+    cost = models.DecimalField(verbose_name="стоимость позиции", decimal_places=2, max_digits=7)
+
+    class Meta:
+        verbose_name = "позиция архивного заказа"
+        verbose_name_plural = "позиции архивных заказов"
+
+    def __str__(self):
+        return f"{self.order} - {self.product}"
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(verbose_name="ключ", max_length=255, unique=True)
+    request_fingerprint = models.CharField(verbose_name="отпечаток запроса", max_length=64)
+    response_status = models.PositiveSmallIntegerField(verbose_name="код ответа", null=True, blank=True)
+    response_body = models.BinaryField(verbose_name="тело ответа", blank=True, default=b"")
+    created_at = models.DateTimeField(verbose_name="время создания", default=timezone.now)
+    expires_at = models.DateTimeField(verbose_name="действует до", db_index=True)
+
+    class Meta:
+        verbose_name = "ключ идемпотентности"
+        verbose_name_plural = "ключи идемпотентности"
+
+    def __str__(self):
+        return self.key
+
+    @property
+    def is_completed(self):
+        return self.response_status is not None
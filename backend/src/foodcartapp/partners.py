@@ -0,0 +1,44 @@
+import hmac
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import BasePermission
+
+
+PARTNER_AUTH_KEYWORD = "Api-Key"
+
+
+def is_partner_key(key):
+    return any(hmac.compare_digest(key, partner_key) for partner_key in settings.PARTNER_API_KEYS)
+
+
+def get_partner_key(request):
+    """Return the partner key the request is signed with, or None if it has no valid one."""
+    header = get_authorization_header(request).decode(errors="replace").split()
+    if len(header) == 2 and header[0] == PARTNER_AUTH_KEYWORD and is_partner_key(header[1]):
+        return header[1]
+    return None
+
+
+class PartnerKeyAuthentication(BaseAuthentication):
+    """Authenticate partner integrations by the `Authorization: Api-Key <key>` header."""
+
+    def authenticate(self, request):
+        header = get_authorization_header(request).decode(errors="replace").split()
+        if not header or header[0] != PARTNER_AUTH_KEYWORD:
+            return None
+        if len(header) != 2:
+            raise AuthenticationFailed("Заголовок Authorization должен содержать один ключ партнёра")
+        if not is_partner_key(header[1]):
+            raise AuthenticationFailed("Неверный ключ партнёра")
+        return AnonymousUser(), header[1]
+
+    def authenticate_header(self, request):
+        return PARTNER_AUTH_KEYWORD
+
+
+class IsPartner(BasePermission):
+    def has_permission(self, request, view):
+        return isinstance(request.successful_authenticator, PartnerKeyAuthentication)
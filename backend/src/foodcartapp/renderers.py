@@ -0,0 +1,34 @@
+from decimal import Decimal
+
+import orjson
+from phonenumber_field.phonenumber import PhoneNumber
+from rest_framework.renderers import BaseRenderer
+
+
+def serialize_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, PhoneNumber):
+        return value.as_e164
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dump_json(data, pretty=False):
+    """Serialize data to compact JSON bytes, or indented ones for debugging."""
+    return orjson.dumps(data, default=serialize_value, option=orjson.OPT_INDENT_2 if pretty else 0)
+
+
+def is_pretty_requested(request):
+    return request.GET.get("pretty") == "1"
+
+
+class FastJSONRenderer(BaseRenderer):
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        request = (renderer_context or {}).get("request")
+        return dump_json(data, pretty=request is not None and is_pretty_requested(request))
@@ -0,0 +1,140 @@
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+
+SEARCH_MIN_TOKEN_LENGTH = 3
+SEARCH_FIELDS = {
+    "foodcartapp_order": ["firstname", "lastname", "phonenumber", "address"],
+    "foodcartapp_product": ["name"],
+}
+
+
+def get_search_expression(table, prefix=""):
+    return " || ' ' || ".join(f"{prefix}{field}" for field in SEARCH_FIELDS[table])
+
+
+def get_search_tokens(query):
+    """Split the query into words long enough to be looked up by trigrams."""
+    return [token for token in query.split() if len(token) >= SEARCH_MIN_TOKEN_LENGTH]
+
+
+def get_postgres_search_sql(table, tokens):
+    expression = get_search_expression(table)
+    conditions = " AND ".join(f"lower({expression}) LIKE lower(%s)" for _ in tokens)
+    patterns = [
+        "%{0}%".format(token.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_"))
+        for token in tokens
+    ]
+    return f"SELECT id FROM {table} WHERE {conditions}", patterns
+
+
+def get_sqlite_search_sql(table, tokens):
+    match = " ".join('"{0}"'.format(token.replace('"', '""')) for token in tokens)
+    return f"SELECT rowid FROM {table}_search WHERE {table}_search MATCH %s", [match]
+
+
+def search(queryset, query):
+    """Filter the queryset down to rows whose search text contains every word of the query.
+
+    Uses a pg_trgm index on PostgreSQL and an FTS5 trigram table on SQLite,
+    both case-insensitive for Cyrillic. Words shorter than three letters are ignored.
+    """
+    tokens = get_search_tokens(query)
+    if not tokens:
+        return queryset.none()
+    table = queryset.model._meta.db_table
+    if connections[queryset.db].vendor == "postgresql":
+        sql, params = get_postgres_search_sql(table, tokens)
+    else:
+        sql, params = get_sqlite_search_sql(table, tokens)
+    return queryset.filter(id__in=RawSQL(sql, params))
+
+
+def get_postgres_index_sql(table):
+    return [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {table}_search_trgm ON {table} "
+        f"USING gin ((lower({get_search_expression(table)})) gin_trgm_ops)",
+    ]
+
+
+def get_sqlite_table_sql(table):
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_search USING fts5(search_text, tokenize='trigram')",
+    ]
+
+
+def get_sqlite_trigger_sql(table):
+    new_search_text = get_search_expression(table, prefix="new.")
+    return {
+        f"{table}_search_insert": f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {table}_search (rowid, search_text) VALUES (new.id, {new_search_text});
+            END
+        """,
+        f"{table}_search_update": f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_update
+            AFTER UPDATE OF {", ".join(SEARCH_FIELDS[table])} ON {table} BEGIN
+                UPDATE {table}_search SET search_text = {new_search_text} WHERE rowid = old.id;
+            END
+        """,
+        f"{table}_search_delete": f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM {table}_search WHERE rowid = old.id;
+            END
+        """,
+    }
+
+
+def fill_sqlite_search_table(cursor, table):
+    cursor.execute(f"DELETE FROM {table}_search")
+    cursor.execute(
+        f"INSERT INTO {table}_search (rowid, search_text) "
+        f"SELECT id, {get_search_expression(table)} FROM {table}"
+    )
+
+
+def install_search_indexes(connection):
+    with connection.cursor() as cursor:
+        for table in SEARCH_FIELDS:
+            if connection.vendor == "postgresql":
+                for sql in get_postgres_index_sql(table):
+                    cursor.execute(sql)
+            elif connection.vendor == "sqlite":
+                for sql in get_sqlite_table_sql(table):
+                    cursor.execute(sql)
+                for sql in get_sqlite_trigger_sql(table).values():
+                    cursor.execute(sql)
+                fill_sqlite_search_table(cursor, table)
+
+
+def repair_search_indexes(connection):
+    """Restore SQLite search triggers dropped when a migration rebuilt the table."""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for table in SEARCH_FIELDS:
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = %s", [f"{table}_search"])
+            if cursor.fetchone() is None:
+                continue
+            triggers = get_sqlite_trigger_sql(table)
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+                [table],
+            )
+            if {name for name, in cursor.fetchall()} >= triggers.keys():
+                continue
+            for sql in triggers.values():
+                cursor.execute(sql)
+            fill_sqlite_search_table(cursor, table)
+
+
+def drop_search_indexes(connection):
+    with connection.cursor() as cursor:
+        for table in SEARCH_FIELDS:
+            if connection.vendor == "postgresql":
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {table}_search_trgm")
+            elif connection.vendor == "sqlite":
+                for trigger in get_sqlite_trigger_sql(table):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+                cursor.execute(f"DROP TABLE IF EXISTS {table}_search")
@@ -1,9 +1,11 @@
 from rest_framework import serializers
 
-from foodcartapp.models import OrderContents, Order
+from foodcartapp.models import OrderContents, Order, Product
 
 
 class OrderContentsSerializer(serializers.ModelSerializer):
+    product = serializers.IntegerField(min_value=1)
+
     class Meta:
         model = OrderContents
         fields = ["product", "quantity"]
@@ -16,20 +18,53 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ["id", "firstname", "lastname", "address", "phonenumber", "products"]
 
+    def validate_products(self, order_contents):
+        available_products = self.context.get("available_products")
+        if available_products is None:
+            product_ids = {fields["product"] for fields in order_contents}
+            available_products = Product.objects.available().in_bulk(product_ids)
+
+        errors = []
+        for fields in order_contents:
+            product = available_products.get(fields["product"])
+            if product is None:
+                errors.append({"product": [f"Товар {fields['product']} не существует или недоступен для заказа."]})
+            else:
+                errors.append({})
+                fields["product"] = product
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return order_contents
+
     def create(self, validated_data):
-        order = Order.objects.create(
-            firstname=validated_data["firstname"],
-            lastname=validated_data["lastname"],
-            phonenumber=validated_data["phonenumber"],
-            address=validated_data["address"],
-        )
-        order_contents_fields = validated_data["products"]
-        products = [field["product"] for field in order_contents_fields]
-        prices = {product.id: product.price for product in products}
-        order_contents = [OrderContents(
-            order=order,
-            cost=prices[fields["product"].id],
-            **fields
-        ) for fields in order_contents_fields]
-        OrderContents.objects.bulk_create(order_contents)
-        return order
+        return create_orders([validated_data])[0]
+
+
+def get_ordered_product_ids(orders_data):
+    product_ids = set()
+    for order_data in orders_data:
+        if not isinstance(order_data, dict) or not isinstance(order_data.get("products"), list):
+            continue
+        for fields in order_data["products"]:
+            if isinstance(fields, dict) and isinstance(fields.get("product"), int):
+                product_ids.add(fields["product"])
+    return product_ids
+
+
+def create_orders(validated_orders):
+    orders = Order.objects.bulk_create([Order(
+        firstname=validated_data["firstname"],
+        lastname=validated_data["lastname"],
+        phonenumber=validated_data["phonenumber"],
+        address=validated_data["address"],
+        intake_tracking_id=validated_data.get("intake_tracking_id"),
+        total_price=sum(fields["product"].price * fields["quantity"] for fields in validated_data["products"]),
+    ) for validated_data in validated_orders])
+    order_contents = [OrderContents(
+        order=order,
+        cost=fields["product"].price,
+        **fields
+    ) for order, validated_data in zip(orders, validated_orders) for fields in validated_data["products"]]
+    OrderContents.objects.bulk_create(order_contents)
+    Order.objects.filter(id__in=[order.id for order in orders]).refresh_available_restaurants()
+    return orders
@@ -0,0 +1,154 @@
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from coordinatesapp.models import GeocodingJob
+from .catalog import bump_banners_version, bump_catalog_version, rebuild_restaurant_menus
+from .models import (
+    ORDER_STATUS_RANKS,
+    Banner,
+    Order,
+    OrderContents,
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+)
+from .search import repair_search_indexes
+
+
+def add_to_commit_batch(callback, ids):
+    """Collect ids from the whole transaction and pass them to the callback once it commits.
+
+    Saving a product with its menu items in the admin fires a signal per item,
+    but the affected orders and menus are refreshed only once.
+    """
+    ids = set(ids)
+    if not ids:
+        return
+    connection = transaction.get_connection()
+    batches = connection.__dict__.setdefault("commit_batches", {})
+    if callback in batches:
+        run, pending_ids = batches[callback]
+        if any(func is run for _, func, _ in connection.run_on_commit):
+            pending_ids |= ids
+            return
+
+    def run():
+        if batches.get(callback, (None,))[0] is run:
+            del batches[callback]
+        callback(ids)
+
+    batches[callback] = (run, ids)
+    transaction.on_commit(run)
+
+
+def refresh_orders_available_restaurants(order_ids):
+    Order.objects.open().filter(id__in=order_ids).refresh_available_restaurants()
+
+
+def refresh_available_restaurants_on_commit(orders):
+    add_to_commit_batch(refresh_orders_available_restaurants, orders.values_list("id", flat=True).distinct())
+
+
+@receiver(pre_save, sender=Order)
+def fill_order_fields_on_fixture_load(sender, instance, raw, **kwargs):
+    """Fill the fields Order.save() and auto_now fill, which loaddata bypasses."""
+    if not raw:
+        return
+    instance.status_rank = ORDER_STATUS_RANKS[instance.status]
+    if instance.updated_at is None:
+        instance.updated_at = instance.created_at or timezone.now()
+
+
+def recalculate_order_totals(order_ids):
+    Order.objects.filter(id__in=order_ids).recalculate_total_price()
+
+
+@receiver(post_save, sender=OrderContents)
+def recalculate_order_total_on_fixture_load(sender, instance, raw, **kwargs):
+    """loaddata saves order lines without OrderContents.save(), so totals are recalculated after the load."""
+    if raw:
+        add_to_commit_batch(recalculate_order_totals, [instance.order_id])
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def update_orders_on_menu_change(sender, instance, **kwargs):
+    affected_orders = Order.objects.open().filter(
+        Q(contents__product=instance.product_id) | Q(available_restaurants=instance.restaurant_id)
+    )
+    refresh_available_restaurants_on_commit(affected_orders)
+
+
+@receiver(post_save, sender=OrderContents)
+@receiver(post_delete, sender=OrderContents)
+def update_order_on_contents_change(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Order) or getattr(origin, "model", None) is Order:
+        return
+    refresh_available_restaurants_on_commit(Order.objects.open().filter(id=instance.order_id))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def invalidate_catalog(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+def rebuild_restaurant_menus_on_commit(restaurant_ids):
+    add_to_commit_batch(rebuild_restaurant_menus, restaurant_ids)
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def update_menu_on_menu_item_change(sender, instance, **kwargs):
+    rebuild_restaurant_menus_on_commit([instance.restaurant_id])
+
+
+@receiver(post_save, sender=Product)
+def update_menus_on_product_change(sender, instance, **kwargs):
+    rebuild_restaurant_menus_on_commit(instance.menu_items.values_list("restaurant", flat=True))
+
+
+@receiver(post_save, sender=ProductCategory)
+def update_menus_on_category_change(sender, instance, **kwargs):
+    rebuild_restaurant_menus_on_commit(
+        RestaurantMenuItem.objects.filter(product__category=instance).values_list("restaurant", flat=True)
+    )
+
+
+@receiver(pre_delete, sender=ProductCategory)
+def remember_menus_of_deleted_category(sender, instance, **kwargs):
+    # Products lose the category through a SET NULL update that sends no signals
+    instance.menu_restaurant_ids = list(
+        RestaurantMenuItem.objects.filter(product__category=instance).values_list("restaurant", flat=True)
+    )
+
+
+@receiver(post_delete, sender=ProductCategory)
+def update_menus_on_category_delete(sender, instance, **kwargs):
+    rebuild_restaurant_menus_on_commit(getattr(instance, "menu_restaurant_ids", []))
+
+
+@receiver(post_save, sender=Restaurant)
+def geocode_restaurant_address(sender, instance, raw, **kwargs):
+    if not raw:
+        GeocodingJob.objects.enqueue([instance.address])
+
+
+@receiver(post_save, sender=Banner)
+@receiver(post_delete, sender=Banner)
+def invalidate_banners(sender, **kwargs):
+    transaction.on_commit(bump_banners_version)
+
+
+@receiver(post_migrate)
+def repair_search_indexes_after_migrate(sender, using, **kwargs):
+    if sender.name == "foodcartapp":
+        repair_search_indexes(connections[using])
@@ -0,0 +1,76 @@
+import gzip
+
+import brotli
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+
+ENCODINGS = ["br", "gzip"]
+
+
+def build_snapshot(name, version, content, last_modified=None):
+    """Prepare a response body together with its compressed variants and validators."""
+    return {
+        "tag": f"{name}-{version}",
+        "last_modified": last_modified,
+        "bodies": {
+            "identity": content,
+            "gzip": gzip.compress(content, compresslevel=9, mtime=0),
+            "br": brotli.compress(content, quality=11),
+        },
+    }
+
+
+def get_accepted_encodings(request):
+    accepted_encodings = set()
+    for coding in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = coding.partition(";")
+        quality = 1
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                pass
+        if coding.strip() and quality > 0:
+            accepted_encodings.add(coding.strip().lower())
+    return accepted_encodings
+
+
+def is_not_modified(request, snapshot):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        return any(
+            etag == "*" or etag.strip('"').split(";")[0] == snapshot["tag"]
+            for etag in parse_etags(if_none_match)
+        )
+    if snapshot["last_modified"] is None:
+        return False
+    if_modified_since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return if_modified_since is not None and snapshot["last_modified"] <= if_modified_since
+
+
+def snapshot_response(request, snapshot, content_type="application/json", max_age=60):
+    accepted_encodings = get_accepted_encodings(request)
+    encoding = next(
+        (encoding for encoding in ENCODINGS if encoding in accepted_encodings),
+        "identity",
+    )
+
+    if is_not_modified(request, snapshot):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(snapshot["bodies"][encoding], content_type=content_type)
+        if encoding != "identity":
+            response["Content-Encoding"] = encoding
+
+    if encoding == "identity":
+        response["ETag"] = f'"{snapshot["tag"]}"'
+    else:
+        response["ETag"] = f'"{snapshot["tag"]};{encoding}"'
+    if snapshot["last_modified"] is not None:
+        response["Last-Modified"] = http_date(snapshot["last_modified"])
+    patch_vary_headers(response, ["Accept-Encoding"])
+    patch_cache_control(response, public=True, max_age=max_age)
+    return response
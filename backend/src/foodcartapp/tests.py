@@ -0,0 +1,346 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.core import serializers
+from django.db import DatabaseError, connection, connections, router
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from star_burger import db_routers
+
+from . import admission, intake
+from .models import ArchivedOrder, IdempotencyKey, Order, OrderContents, Product, ProductCategory, Restaurant, RestaurantMenu, RestaurantMenuItem
+
+
+@override_settings(ORDER_INTAKE_MODE="direct", ORDER_ADMISSION_ENABLED=False)
+class RegisterOrderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        restaurant = Restaurant.objects.create(name="Star Burger", address="Москва, Тверская 1")
+        cls.products = Product.objects.bulk_create([
+            Product(name=f"Бургер {number}", price=100 + number, image="burger.jpg")
+            for number in range(20)
+        ])
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=restaurant, product=product)
+            for product in cls.products
+        ])
+
+    def post_order(self, products):
+        return self.client.post("/api/order/", {
+            "firstname": "Иван",
+            "lastname": "Петров",
+            "phonenumber": "+79291234567",
+            "address": "Москва, Тверская 2",
+            "products": [{"product": product.id, "quantity": 2} for product in products],
+        }, content_type="application/json")
+
+    def test_query_count_does_not_depend_on_order_lines(self):
+        for products in (self.products[:1], self.products):
+            with self.subTest(lines=len(products)), self.assertNumQueries(12):
+                response = self.post_order(products)
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(
+            [order.contents.count() for order in Order.objects.order_by("id")],
+            [1, 20],
+        )
+
+
+
+@override_settings(ORDER_INTAKE_MODE="write_behind", ORDER_ADMISSION_ENABLED=False)
+class WriteBehindOrderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        restaurant = Restaurant.objects.create(name="Star Burger", address="Москва, Тверская 1")
+        cls.product = Product.objects.create(name="Бургер", price=100, image="burger.jpg")
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=cls.product)
+
+    def setUp(self):
+        log_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(log_dir.cleanup)
+        log_settings = override_settings(ORDER_INTAKE_LOG_PATH=os.path.join(log_dir.name, "intake.sqlite3"))
+        log_settings.enable()
+        self.addCleanup(log_settings.disable)
+        self.addCleanup(self.close_intake_log)
+
+    @staticmethod
+    def close_intake_log():
+        intake.get_intake_log().close()
+        del intake._local.connection
+
+    def post_order(self, quantity, idempotency_key):
+        return self.client.post("/api/order/", {
+            "firstname": "Иван",
+            "lastname": "Петров",
+            "phonenumber": "+79291234567",
+            "address": "Москва, Тверская 2",
+            "products": [{"product": self.product.id, "quantity": quantity}],
+        }, content_type="application/json", headers={"Idempotency-Key": idempotency_key})
+
+    def test_idempotency_keys_are_kept_in_the_intake_log(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_order(1, "checkout-1")
+            replayed_response = self.post_order(1, "checkout-1")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(replayed_response.status_code, 202)
+        self.assertEqual(replayed_response["Idempotent-Replayed"], "true")
+        self.assertEqual(replayed_response.json()["tracking_id"], response.json()["tracking_id"])
+        self.assertTrue(all(query["sql"].startswith("SELECT") for query in queries))
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.assertEqual(self.post_order(2, "checkout-1").status_code, 422)
+
+
+
+@override_settings(
+    ORDER_INTAKE_MODE="direct",
+    ORDER_ADMISSION_ENABLED=True,
+    ORDER_ADMISSION_IP_RATE=0.001,
+    ORDER_ADMISSION_IP_BURST=2,
+)
+class AdmissionControlTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        restaurant = Restaurant.objects.create(name="Star Burger", address="Москва, Тверская 1")
+        cls.product = Product.objects.create(name="Бургер", price=100, image="burger.jpg")
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=cls.product)
+
+    def setUp(self):
+        store_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(store_dir.cleanup)
+        store_settings = override_settings(ORDER_ADMISSION_STORE_PATH=os.path.join(store_dir.name, "admission.sqlite3"))
+        store_settings.enable()
+        self.addCleanup(store_settings.disable)
+        self.addCleanup(self.close_admission_store)
+
+    @staticmethod
+    def close_admission_store():
+        admission.get_admission_store().close()
+        del admission._local.connection
+
+    def post_order(self, idempotency_key):
+        return self.client.post("/api/order/", {
+            "firstname": "Иван",
+            "lastname": "Петров",
+            "phonenumber": "+79291234567",
+            "address": "Москва, Тверская 2",
+            "products": [{"product": self.product.id, "quantity": 1}],
+        }, content_type="application/json", headers={"Idempotency-Key": idempotency_key})
+
+    def test_replays_do_not_use_up_tokens(self):
+        self.assertEqual(self.post_order("checkout-1").status_code, 200)
+        for _ in range(3):
+            response = self.post_order("checkout-1")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Idempotent-Replayed"], "true")
+
+        self.assertEqual(self.post_order("checkout-2").status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.post_order("checkout-3")
+        self.assertEqual(response.status_code, 429)
+
+
+@override_settings(ORDER_ADMISSION_ENABLED=False, PARTNER_API_KEYS=["partner-key"])
+class RegisterOrdersBatchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        restaurant = Restaurant.objects.create(name="Star Burger", address="Москва, Тверская 1")
+        cls.product = Product.objects.create(name="Бургер", price=100, image="burger.jpg")
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=cls.product)
+
+    def post_batch(self, **headers):
+        return self.client.post("/api/orders/batch/", [{
+            "firstname": "Иван",
+            "lastname": "Петров",
+            "phonenumber": "+79291234567",
+            "address": "Москва, Тверская 2",
+            "products": [{"product": self.product.id, "quantity": 1}],
+        }], content_type="application/json", headers=headers)
+
+    def test_rejects_requests_without_partner_key(self):
+        for headers in ({}, {"Authorization": "Api-Key wrong-key"}, {"Authorization": "Token partner-key"}):
+            with self.subTest(headers=headers):
+                response = self.post_batch(**headers)
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response["WWW-Authenticate"], "Api-Key")
+        self.assertFalse(Order.objects.exists())
+
+    def test_accepts_partner_key(self):
+        response = self.post_batch(Authorization="Api-Key partner-key")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class AvailableRestaurantsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = Restaurant.objects.create(name="Star Burger", address="Москва, Тверская 1")
+        cls.products = Product.objects.bulk_create([
+            Product(name=f"Бургер {number}", price=100, image="burger.jpg")
+            for number in range(3)
+        ])
+        cls.menu_items = RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=cls.restaurant, product=product)
+            for product in cls.products
+        ])
+
+    def create_orders(self, count):
+        orders = Order.objects.bulk_create([
+            Order(firstname="Иван", lastname="Петров", phonenumber="+79291234567", address="Москва, Тверская 2")
+            for _ in range(count)
+        ])
+        OrderContents.objects.bulk_create([
+            OrderContents(order=order, product=self.products[0], quantity=1, cost=100)
+            for order in orders
+        ])
+        Order.objects.filter(id__in=[order.id for order in orders]).refresh_available_restaurants()
+        return orders
+
+    def test_menu_items_saved_together_refresh_orders_once(self):
+        self.create_orders(1)
+        with mock.patch("foodcartapp.signals.refresh_orders_available_restaurants") as refresh, \
+                mock.patch("foodcartapp.signals.rebuild_restaurant_menus") as rebuild, \
+                self.captureOnCommitCallbacks(execute=True):
+            for menu_item in self.menu_items:
+                menu_item.availability = False
+                menu_item.save()
+        refresh.assert_called_once()
+        rebuild.assert_called_once_with({self.restaurant.id})
+
+    def test_menu_change_updates_many_orders(self):
+        orders = self.create_orders(1500)
+        menu_item = self.menu_items[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            menu_item.availability = False
+            menu_item.save()
+        self.assertFalse(
+            Order.available_restaurants.through.objects.filter(order__in=[order.id for order in orders]).exists()
+        )
+
+
+class FixtureLoadTest(TestCase):
+    def test_order_totals_are_recalculated_after_raw_load(self):
+        product = Product.objects.create(name="Бургер", price=100, image="burger.jpg")
+        order = Order.objects.create(firstname="Иван", lastname="Петров", phonenumber="+79291234567", address="Москва")
+        OrderContents.objects.create(order=order, product=product, quantity=3, cost=100)
+        fixture = serializers.serialize("json", [order, *order.contents.all()])
+        Order.objects.all().delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for loaded_object in serializers.deserialize("json", fixture):
+                loaded_object.object.total_price = 0
+                loaded_object.save()
+
+        self.assertEqual(Order.objects.get().total_price, 300)
+        self.assertFalse(Order.objects.with_wrong_total_price().exists())
+
+
+class RestaurantMenuTest(TestCase):
+    def test_deleted_category_leaves_menus(self):
+        restaurant = Restaurant.objects.create(name="Star Burger", address="Москва, Тверская 1")
+        category = ProductCategory.objects.create(name="Бургеры")
+        product = Product.objects.create(name="Чизбургер", category=category, price=100, image="burger.jpg")
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+        self.assertIn("Бургеры", RestaurantMenu.objects.get(restaurant=restaurant).content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            category.delete()
+
+        menu = RestaurantMenu.objects.get(restaurant=restaurant)
+        self.assertNotIn("Бургеры", menu.content)
+        self.assertIn("Чизбургер", menu.content)
+
+
+if "replica_1" not in connections.settings:
+    # Without configured replicas the tests read from a mirror of the test database
+    connections.settings["replica_1"] = {
+        **connections.settings["default"],
+        "TEST": {**connections.settings["default"]["TEST"], "MIRROR": "default"},
+    }
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"], ORDER_INTAKE_MODE="direct", ORDER_ADMISSION_ENABLED=False)
+class ReplicaRouterTest(TestCase):
+    databases = {"default", "replica_1"}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = Restaurant.objects.create(name="Star Burger", address="Москва, Тверская 1")
+        cls.product = Product.objects.create(name="Бургер", price=100, image="burger.jpg")
+        RestaurantMenuItem.objects.create(restaurant=cls.restaurant, product=cls.product)
+
+    def setUp(self):
+        # Writes in setUpTestData pin this thread to the primary, as they would in a request
+        pin_token = db_routers._primary_pinned.set(False)
+        self.addCleanup(db_routers._primary_pinned.reset, pin_token)
+        db_routers._replica_health.clear()
+        self.addCleanup(db_routers._replica_health.clear)
+        lag_patcher = mock.patch("star_burger.db_routers.get_replica_lag", return_value=0)
+        self.replica_lag = lag_patcher.start()
+        self.addCleanup(lag_patcher.stop)
+
+        replica = connections["replica_1"]
+        if replica.vendor == "sqlite":
+            # The mirror shares the in-memory test database, let it see the test's uncommitted rows
+            with replica.cursor() as cursor:
+                cursor.execute("PRAGMA read_uncommitted = true")
+
+    @staticmethod
+    def read_from_replica():
+        return db_routers.read_from_replica(router.db_for_read)(Product)
+
+    def test_replica_reads_are_opt_in(self):
+        self.assertEqual(router.db_for_read(Product), "default")
+        self.assertEqual(self.read_from_replica(), "replica_1")
+        self.assertEqual(router.db_for_read(ArchivedOrder), "replica_1")
+
+        def read_primary():
+            with db_routers.use_primary():
+                return router.db_for_read(Product)
+        self.assertEqual(db_routers.read_from_replica(read_primary)(), "default")
+
+    def test_writes_pin_reads_to_primary(self):
+        self.assertEqual(self.read_from_replica(), "replica_1")
+        self.assertEqual(router.db_for_write(Product), "default")
+        self.assertEqual(self.read_from_replica(), "default")
+
+    def test_lagging_replica_is_skipped(self):
+        self.replica_lag.return_value = 60
+        with self.assertLogs("star_burger.db_routers", level="WARNING"):
+            self.assertEqual(self.read_from_replica(), "default")
+
+        db_routers._replica_health.clear()
+        self.replica_lag.side_effect = DatabaseError
+        with self.assertLogs("star_burger.db_routers", level="ERROR"):
+            self.assertEqual(self.read_from_replica(), "default")
+
+    def test_lag_is_checked_once_per_interval(self):
+        for _ in range(3):
+            self.read_from_replica()
+        self.replica_lag.assert_called_once_with("replica_1")
+
+    def get_menu(self):
+        with CaptureQueriesContext(connections["replica_1"]) as replica_queries:
+            response = self.client.get(f"/api/restaurants/{self.restaurant.id}/menu/")
+        self.assertEqual(response.status_code, 200)
+        return len(replica_queries)
+
+    def test_pin_cookie_keeps_client_on_primary(self):
+        self.assertGreater(self.get_menu(), 0)
+
+        response = self.client.post("/api/order/", {
+            "firstname": "Иван",
+            "lastname": "Петров",
+            "phonenumber": "+79291234567",
+            "address": "Москва, Тверская 2",
+            "products": [{"product": self.product.id, "quantity": 1}],
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(db_routers.PRIMARY_PIN_COOKIE, response.cookies)
+        self.assertEqual(self.get_menu(), 0)
+
+        self.client.cookies[db_routers.PRIMARY_PIN_COOKIE] = "0"
+        self.assertGreater(self.get_menu(), 0)
@@ -1,6 +1,13 @@
 from django.urls import path
 
-from .views import product_list_api, banners_list_api, register_order
+from .views import (
+    banners_list_api,
+    order_intake_status,
+    product_list_api,
+    register_order,
+    register_orders_batch,
+    restaurant_menu_api,
+)
 
 
 app_name = "foodcartapp"
@@ -8,5 +15,8 @@ app_name = "foodcartapp"
 urlpatterns = [
     path('products/', product_list_api),
     path('banners/', banners_list_api),
+    path('restaurants/<int:restaurant_id>/menu/', restaurant_menu_api),
     path('order/', register_order),
+    path('order/<uuid:tracking_id>/', order_intake_status),
+    path('orders/batch/', register_orders_batch),
 ]
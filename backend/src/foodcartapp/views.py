@@ -1,73 +1,169 @@
+import json
+import sqlite3
+
+from django.conf import settings
 from django.db import transaction
-from django.http import JsonResponse
-from django.templatetags.static import static
-from rest_framework.decorators import api_view
+from django.http import Http404, HttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_safe
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
 
-from .models import Product, Order, OrderContents
-from .serializers import OrderSerializer
+from coordinatesapp.models import GeocodingJob
+from star_burger.db_routers import read_from_replica
+from .admission import admission_controlled
+from .catalog import (
+    dump_banners,
+    dump_products,
+    get_banners_snapshot,
+    get_catalog_snapshot,
+    get_restaurant_menu_snapshot,
+)
+from .idempotency import get_request_fingerprint, get_scoped_idempotency_key, idempotent
+from .intake import append_order, get_idempotent_intake, get_intake_status
+from .models import Product
+from .partners import IsPartner, PartnerKeyAuthentication, get_partner_key
+from .renderers import dump_json, is_pretty_requested
+from .serializers import OrderSerializer, create_orders, get_ordered_product_ids
+from .snapshots import snapshot_response
+
+
+ORDERS_BATCH_MAX_SIZE = 500
+
 
+def get_orders_batch_size(request):
+    """Count the orders in a batch for admission control.
 
+    Requests without a partner key are rejected before any work, so they cost one token.
+    """
+    if get_partner_key(request) is None:
+        return 1
+    try:
+        orders_data = json.loads(request.body)
+    except ValueError:
+        return 1
+    if not isinstance(orders_data, list) or not orders_data:
+        return 1
+    return min(len(orders_data), ORDERS_BATCH_MAX_SIZE)
+
+
+@require_safe
 def banners_list_api(request):
-    # FIXME move data to db?
-    return JsonResponse([
-        {
-            'title': 'Burger',
-            'src': static('burger.jpg'),
-            'text': 'Tasty Burger at your door step',
-        },
-        {
-            'title': 'Spices',
-            'src': static('food.jpg'),
-            'text': 'All Cuisines',
-        },
-        {
-            'title': 'New York',
-            'src': static('tasty.jpg'),
-            'text': 'Food is incomplete without a tasty dessert',
-        }
-    ], safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    if is_pretty_requested(request):
+        return HttpResponse(dump_json(dump_banners(timezone.now()), pretty=True), content_type="application/json")
+    snapshot, valid_for = get_banners_snapshot()
+    return snapshot_response(request, snapshot, max_age=min(int(valid_for), 60 * 60))
 
 
+@require_safe
 def product_list_api(request):
-    products = Product.objects.select_related('category').available()
-
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            } if product.category else None,
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-            }
-        }
-        dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    if is_pretty_requested(request):
+        return HttpResponse(dump_json(dump_products(), pretty=True), content_type="application/json")
+    return snapshot_response(request, get_catalog_snapshot())
+
+
+@require_safe
+@read_from_replica
+def restaurant_menu_api(request, restaurant_id):
+    snapshot = get_restaurant_menu_snapshot(restaurant_id)
+    if snapshot is None:
+        raise Http404("Ресторан не найден")
+    return snapshot_response(request, snapshot)
+
+
+def is_write_behind(request):
+    return settings.ORDER_INTAKE_MODE == "write_behind"
+
+
+def replay_accepted_order(idempotency_key, request_fingerprint):
+    accepted = get_idempotent_intake(idempotency_key)
+    if accepted is None:
+        return None
+    if accepted["request_fingerprint"] != request_fingerprint:
+        return Response({"error": "Ключ уже использован для другого запроса"}, status=422)
+    return Response(
+        {"tracking_id": accepted["tracking_id"], "status": "pending"},
+        status=202,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def accept_order(request):
+    """Append the order to the write-behind log without touching the main database.
 
+    Idempotency keys are kept in the log next to the orders they were sent with.
+    """
+    idempotency_key = get_scoped_idempotency_key(request)
+    request_fingerprint = get_request_fingerprint(request)
+    if idempotency_key:
+        replay = replay_accepted_order(idempotency_key, request_fingerprint)
+        if replay:
+            return replay
 
+    serializer = OrderSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    try:
+        tracking_id = append_order(serializer.validated_data, idempotency_key, request_fingerprint)
+    except sqlite3.IntegrityError:
+        return replay_accepted_order(idempotency_key, request_fingerprint)
+    return Response({"tracking_id": tracking_id, "status": "pending"}, status=202)
+
+
+@admission_controlled
+@idempotent(unless=is_write_behind)
 @api_view(["POST"])
-@transaction.atomic
 def register_order(request):
+    if is_write_behind(request):
+        return accept_order(request)
+
     serializer = OrderSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
 
-    order = serializer.create(serializer.validated_data)
-    
+    with transaction.atomic():
+        order = serializer.create(serializer.validated_data)
+        GeocodingJob.objects.enqueue([order.address])
+
     return Response(
         OrderSerializer(order).data
     )
+
+
+@api_view(["GET"])
+def order_intake_status(request, tracking_id):
+    intake_status = get_intake_status(tracking_id)
+    if intake_status is None:
+        raise Http404("Заказ с таким номером отслеживания не найден")
+    return Response({"tracking_id": tracking_id, **intake_status})
+
+
+@admission_controlled(get_cost=get_orders_batch_size)
+@idempotent
+@api_view(["POST"])
+@authentication_classes([PartnerKeyAuthentication])
+@permission_classes([IsPartner])
+@transaction.atomic
+def register_orders_batch(request):
+    orders_data = request.data
+    if not isinstance(orders_data, list) or not orders_data:
+        return Response({"error": "Ожидается непустой список заказов"}, status=400)
+    if len(orders_data) > ORDERS_BATCH_MAX_SIZE:
+        return Response({"error": f"Не больше {ORDERS_BATCH_MAX_SIZE} заказов за запрос"}, status=400)
+
+    available_products = Product.objects.available().in_bulk(get_ordered_product_ids(orders_data))
+    results = []
+    validated_orders = []
+    for order_data in orders_data:
+        serializer = OrderSerializer(data=order_data, context={"available_products": available_products})
+        if serializer.is_valid():
+            validated_orders.append(serializer.validated_data)
+            results.append({"created": True})
+        else:
+            results.append({"created": False, "errors": serializer.errors})
+
+    orders = iter(create_orders(validated_orders))
+    for result in results:
+        if result["created"]:
+            result["order"] = OrderSerializer(next(orders)).data
+    GeocodingJob.objects.enqueue([validated_data["address"] for validated_data in validated_orders])
+
+    return Response({"results": results})
@@ -1,38 +1,151 @@
 import functools
+import itertools
 import logging
-from time import sleep
+import random
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
 
+import numpy as np
 import requests
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
-from geopy import distance
+from requests.adapters import HTTPAdapter
 
-from coordinatesapp.models import Location
+from coordinatesapp.models import GeocodingJob, Location
+from foodcartapp.models import Order, Restaurant
 
 
-def retry_on_failure(max_retries=5, exceptions=(Exception,)):
+EARTH_RADIUS_KM = 6371.0088
+
+
+geocoder_session = requests.Session()
+geocoder_session.mount("https://", HTTPAdapter(pool_maxsize=settings.GEOCODER_MAX_WORKERS))
+
+geocoder_stats = Counter()
+_geocoder_stats_lock = threading.Lock()
+
+
+def count_geocoder_event(event):
+    with _geocoder_stats_lock:
+        geocoder_stats[event] += 1
+
+
+def count_geocoder_call(latency):
+    with _geocoder_stats_lock:
+        geocoder_stats["calls"] += 1
+        geocoder_stats["latency"] += latency
+
+
+def get_geocoder_stats():
+    with _geocoder_stats_lock:
+        stats = dict(geocoder_stats)
+    if stats.get("calls"):
+        stats["average_latency"] = stats["latency"] / stats["calls"]
+    return stats
+
+
+class CircuitOpenError(requests.RequestException):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allows_call(self):
+        with self.lock:
+            return self.opened_at is None or monotonic() - self.opened_at >= self.reset_timeout
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures < self.failure_threshold:
+                return
+            if self.opened_at is None:
+                count_geocoder_event("circuit_trips")
+            self.opened_at = monotonic()
+
+
+geocoder_circuit = CircuitBreaker(
+    failure_threshold=settings.GEOCODER_CIRCUIT_THRESHOLD,
+    reset_timeout=settings.GEOCODER_CIRCUIT_RESET_TIMEOUT,
+)
+
+
+def is_transient_error(error):
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and (
+            error.response.status_code >= 500 or error.response.status_code == 429
+        )
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def with_retry_policy(circuit):
+    """Retry transient failures with jittered exponential backoff.
+
+    Every attempt gets a timeout that fits into the remaining deadline,
+    and calls are rejected without touching the network while the
+    circuit is open.
+    """
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            for retry_attempt in range(max_retries):
+            if not circuit.allows_call():
+                count_geocoder_event("rejected")
+                raise CircuitOpenError(f"{func.__name__} is unavailable, circuit is open")
+
+            deadline = monotonic() + settings.GEOCODER_DEADLINE
+            for attempt in itertools.count():
+                timeout = min(settings.GEOCODER_TIMEOUT, deadline - monotonic())
+                started_at = monotonic()
                 try:
-                    return func(*args, **kwargs)
-                except exceptions as e:
-                    logging.warning(f"Failed to execute {func.__name__}. Retrying in {4 ** retry_attempt}s. Error: {e}")
-                    sleep(4 ** retry_attempt)
-            logging.error(f"Failed to execute {func.__name__} after {max_retries} attempts.")
+                    result = func(*args, timeout=timeout, **kwargs)
+                except requests.RequestException as error:
+                    count_geocoder_call(monotonic() - started_at)
+                    if not is_transient_error(error):
+                        raise
+                    count_geocoder_event("failures")
+                    circuit.record_failure()
+                    delay = random.uniform(0, settings.GEOCODER_BACKOFF * 2 ** attempt)
+                    if (
+                        attempt + 1 >= settings.GEOCODER_MAX_RETRIES
+                        or monotonic() + delay + settings.GEOCODER_MIN_TIMEOUT >= deadline
+                        or not circuit.allows_call()
+                    ):
+                        logging.error(f"Failed to execute {func.__name__} after {attempt + 1} attempts: {error}")
+                        raise
+                    logging.warning(f"Failed to execute {func.__name__}. Retrying in {delay:.2f}s. Error: {error}")
+                    count_geocoder_event("retries")
+                    sleep(delay)
+                else:
+                    count_geocoder_call(monotonic() - started_at)
+                    circuit.record_success()
+                    return result
         return wrapper
     return decorator
 
 
-@retry_on_failure(max_retries=3, exceptions=(requests.ConnectionError,))
-def fetch_coordinates(apikey, address):
+@with_retry_policy(geocoder_circuit)
+def fetch_coordinates(apikey, address, timeout=None):
     base_url = "https://geocode-maps.yandex.ru/1.x"
-    response = requests.get(base_url, params={
+    response = geocoder_session.get(base_url, params={
         "geocode": address,
         "apikey": apikey,
         "format": "json",
-    })
+    }, timeout=timeout)
     response.raise_for_status()
     found_places = response.json()['response']['GeoObjectCollection']['featureMember']
 
@@ -44,29 +157,166 @@ def fetch_coordinates(apikey, address):
     return lon, lat
 
 
-def get_location(address):
+_cached_locations = OrderedDict()
 
-    location, created = Location.objects.get_or_create(
-        address=address,
-        defaults={
-            "last_fetched": timezone.now()
-        }
-    )
-    if created or None in (location.lon, location.lat):
-        coords = fetch_coordinates(settings.YANDEX_API_KEY, location.address)
-        try:
-            if coords:
-                location.lon, location.lat = coords
-                location.save()
-        except (ValueError, TypeError) as error:
-            logging.warning("Couldn't unpack coords\n", error)
-    return location
+
+def remember_location(location):
+    _cached_locations[location.address] = location
+    _cached_locations.move_to_end(location.address)
+    while len(_cached_locations) > settings.GEOCODER_LRU_SIZE:
+        _cached_locations.popitem(last=False)
 
 
-def calculate_distance(location_1, location_2):
-    coordinates_1 = location_1.lat, location_1.lon
-    coordinates_2 = location_2.lat, location_2.lon
-    if None not in coordinates_1 and None not in coordinates_2:
-        return str(round(distance.distance(coordinates_1, coordinates_2).km, 2)) + " км"
+def geocode(location, geocoder=fetch_coordinates):
+    try:
+        coords = geocoder(settings.YANDEX_API_KEY, location.address)
+    except requests.RequestException as error:
+        logging.warning(f"Couldn't fetch coordinates for {location.address}: {error}")
+        location.fetch_status = "failed"
     else:
-        return "Ошибка определения координат"
+        if coords:
+            location.lon, location.lat = map(float, coords)
+            location.fetch_status = "found"
+        else:
+            location.fetch_status = "not_found"
+    location.last_fetched = timezone.now()
+    return location
+
+
+def update_coordinates(locations, geocoder=fetch_coordinates):
+    locations = list(locations)
+    if not locations:
+        return
+    max_workers = min(settings.GEOCODER_MAX_WORKERS, len(locations))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(functools.partial(geocode, geocoder=geocoder), locations))
+    Location.objects.bulk_update(locations, ["lon", "lat", "fetch_status", "last_fetched"])
+
+
+def get_locations(addresses, geocoder=fetch_coordinates):
+    addresses = set(addresses)
+    locations = {}
+    for address in addresses:
+        location = _cached_locations.get(address)
+        if location and not location.is_expired():
+            _cached_locations.move_to_end(address)
+            locations[address] = location
+
+    missing_addresses = addresses - locations.keys()
+    if missing_addresses:
+        stored_locations = Location.objects.in_bulk(missing_addresses, field_name="address")
+        new_addresses = missing_addresses - stored_locations.keys()
+        if new_addresses:
+            Location.objects.bulk_create(
+                [Location(address=address, last_fetched=timezone.now()) for address in new_addresses],
+                ignore_conflicts=True,
+            )
+            stored_locations.update(Location.objects.in_bulk(new_addresses, field_name="address"))
+
+        update_coordinates(
+            (
+                location for address, location in stored_locations.items()
+                if address in new_addresses or location.is_expired()
+            ),
+            geocoder=geocoder,
+        )
+        for location in stored_locations.values():
+            remember_location(location)
+        locations.update(stored_locations)
+    return locations
+
+
+def get_stored_locations(addresses):
+    """Return already geocoded locations without calling the geocoder or writing anything.
+
+    Addresses the worker has not geocoded yet come back without coordinates.
+    """
+    addresses = set(addresses)
+    locations = {}
+    for address in addresses:
+        location = _cached_locations.get(address)
+        if location and not location.is_expired():
+            _cached_locations.move_to_end(address)
+            locations[address] = location
+
+    missing_addresses = addresses - locations.keys()
+    if missing_addresses:
+        stored_locations = Location.objects.in_bulk(missing_addresses, field_name="address")
+        for location in stored_locations.values():
+            remember_location(location)
+        locations.update(stored_locations)
+    for address in addresses - locations.keys():
+        locations[address] = Location(address=address)
+    return locations
+
+
+def enqueue_stale_addresses():
+    """Queue addresses of open orders and restaurants that have no coordinates yet or whose coordinates expired."""
+    now = timezone.now()
+    expired = Q()
+    for fetch_status, ttl in settings.GEOCODER_CACHE_TTL.items():
+        expired |= Q(fetch_status=fetch_status, last_fetched__lt=now - ttl)
+    used_addresses = [
+        Order.objects.open().values("address"),
+        Restaurant.objects.values("address"),
+    ]
+    stale_addresses = set()
+    for addresses in used_addresses:
+        stale_addresses.update(
+            Location.objects.filter(expired, address__in=addresses).values_list("address", flat=True)
+        )
+        stale_addresses.update(
+            addresses.exclude(address__in=Location.objects.values("address")).values_list("address", flat=True)
+        )
+    GeocodingJob.objects.enqueue(stale_addresses)
+    return len(stale_addresses)
+
+
+def process_geocoding_jobs(batch_size, geocoder=fetch_coordinates):
+    with transaction.atomic():
+        jobs = list(GeocodingJob.objects.due().select_for_update(skip_locked=True)[:batch_size])
+        GeocodingJob.objects.filter(id__in=[job.id for job in jobs]).update(
+            next_attempt_at=timezone.now() + settings.GEOCODER_JOB_LEASE
+        )
+    if not jobs:
+        return 0
+
+    locations = get_locations([job.address for job in jobs], geocoder=geocoder)
+
+    done_jobs = set()
+    for job in jobs:
+        job.attempts += 1
+        if locations[job.address].fetch_status != "failed" or job.attempts >= settings.GEOCODER_MAX_ATTEMPTS:
+            done_jobs.add(job.id)
+        else:
+            job.next_attempt_at = timezone.now() + settings.GEOCODER_CACHE_TTL["failed"]
+    GeocodingJob.objects.filter(id__in=done_jobs).delete()
+    GeocodingJob.objects.bulk_update(
+        [job for job in jobs if job.id not in done_jobs],
+        ["attempts", "next_attempt_at"],
+    )
+    return len(jobs)
+
+
+def calculate_distances(locations_from, locations_to):
+    """Return a masked matrix of distances in km between two lists of locations.
+
+    Pairs where either location has no coordinates are masked.
+    """
+    coordinates_from = np.array(
+        [(location.lat, location.lon) for location in locations_from], dtype=float
+    ).reshape(-1, 2)
+    coordinates_to = np.array(
+        [(location.lat, location.lon) for location in locations_to], dtype=float
+    ).reshape(-1, 2)
+    lat_from, lon_from = np.radians(coordinates_from).T
+    lat_to, lon_to = np.radians(coordinates_to).T
+
+    lat_delta = lat_to[np.newaxis, :] - lat_from[:, np.newaxis]
+    lon_delta = lon_to[np.newaxis, :] - lon_from[:, np.newaxis]
+    haversine = (
+        np.sin(lat_delta / 2) ** 2
+        + np.cos(lat_from)[:, np.newaxis] * np.cos(lat_to)[np.newaxis, :] * np.sin(lon_delta / 2) ** 2
+    )
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(haversine, 0, 1)))
+    return np.ma.masked_invalid(distances)
@@ -0,0 +1,36 @@
+from time import monotonic, sleep
+
+from django.core.management.base import BaseCommand
+
+from restaurateur.helper_functions import enqueue_stale_addresses, get_geocoder_stats, process_geocoding_jobs
+
+
+class Command(BaseCommand):
+    help = "Геокодирует адреса из очереди задач геокодирования"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--loop", action="store_true", help="Не завершаться, ожидая новые задачи")
+        parser.add_argument("--interval", type=float, default=5, help="Пауза между проверками очереди, с")
+        parser.add_argument(
+            "--refresh-interval",
+            type=float,
+            default=60,
+            help="Как часто искать заказы и рестораны без координат или с устаревшими координатами, с",
+        )
+
+    def handle(self, *args, batch_size, loop, interval, refresh_interval, **options):
+        refreshed_at = None
+        while True:
+            if refreshed_at is None or monotonic() - refreshed_at >= refresh_interval:
+                queued = enqueue_stale_addresses()
+                refreshed_at = monotonic()
+                if queued:
+                    self.stdout.write(f"Поставлено в очередь адресов без актуальных координат: {queued}")
+            processed = process_geocoding_jobs(batch_size)
+            if processed:
+                self.stdout.write(f"Обработано адресов: {processed}. Статистика геокодера: {get_geocoder_stats()}")
+            elif not loop:
+                return
+            else:
+                sleep(interval)
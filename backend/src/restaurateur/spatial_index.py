@@ -0,0 +1,120 @@
+import heapq
+import math
+from collections import defaultdict
+
+from foodcartapp.models import Restaurant
+from restaurateur.helper_functions import EARTH_RADIUS_KM, get_stored_locations
+
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_distance(lat_1, lon_1, lat_2, lon_2):
+    lat_1, lon_1, lat_2, lon_2 = map(math.radians, (lat_1, lon_1, lat_2, lon_2))
+    haversine = (
+        math.sin((lat_2 - lat_1) / 2) ** 2
+        + math.cos(lat_1) * math.cos(lat_2) * math.sin((lon_2 - lon_1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(haversine, 1)))
+
+
+class RestaurantIndex:
+    """Grid index over restaurant coordinates for k nearest neighbour queries.
+
+    Cells are roughly `cell_size` km wide. A query scans rings of cells
+    around the point and stops as soon as no unseen cell can hold
+    anything closer than the k-th candidate found so far.
+    """
+
+    def __init__(self, coordinates, cell_size=2):
+        self.coordinates = coordinates
+        self.cells = defaultdict(list)
+        if not coordinates:
+            return
+
+        latitudes = [lat for lat, lon in coordinates.values()]
+        widest_lat = min(max(map(abs, latitudes)), 89)
+        self.lat_step = cell_size / KM_PER_DEGREE
+        self.lon_step = cell_size / (KM_PER_DEGREE * math.cos(math.radians(widest_lat)))
+        self.cell_size = cell_size
+        self.widest_lat = widest_lat
+
+        for restaurant_id, (lat, lon) in coordinates.items():
+            self.cells[self.get_cell(lat, lon)].append((restaurant_id, lat, lon))
+
+    def get_cell(self, lat, lon):
+        return math.floor(lat / self.lat_step), math.floor(lon / self.lon_step)
+
+    def nearest(self, lat, lon, k, restaurant_ids=None):
+        """Return up to k (restaurant_id, distance in km) pairs, nearest first."""
+        if not self.cells:
+            return []
+        row, column = self.get_cell(lat, lon)
+        max_ring = max(
+            max(abs(cell_row - row), abs(cell_column - column))
+            for cell_row, cell_column in self.cells
+        )
+
+        ring_width = self.cell_size * min(
+            1, math.cos(math.radians(lat)) / math.cos(math.radians(self.widest_lat))
+        )
+        candidates = []
+        for ring in range(max_ring + 1):
+            for cell in self.get_ring_cells(row, column, ring):
+                for restaurant_id, restaurant_lat, restaurant_lon in self.cells.get(cell, ()):
+                    if restaurant_ids is not None and restaurant_id not in restaurant_ids:
+                        continue
+                    distance = haversine_distance(lat, lon, restaurant_lat, restaurant_lon)
+                    candidates.append((distance, restaurant_id))
+            if len(candidates) >= k and heapq.nsmallest(k, candidates)[-1][0] <= ring * ring_width:
+                break
+        return [(restaurant_id, distance) for distance, restaurant_id in heapq.nsmallest(k, candidates)]
+
+    @staticmethod
+    def get_ring_cells(row, column, ring):
+        if ring == 0:
+            yield row, column
+            return
+        for offset in range(-ring, ring + 1):
+            yield row - ring, column + offset
+            yield row + ring, column + offset
+        for offset in range(-ring + 1, ring):
+            yield row + offset, column - ring
+            yield row + offset, column + ring
+
+
+_restaurant_index = None
+
+
+def get_restaurant_index(restaurants, locations):
+    """Return the index for the restaurants, rebuilding it only when their coordinates change."""
+    global _restaurant_index
+    coordinates = {}
+    for restaurant in restaurants:
+        location = locations[restaurant.address]
+        if None not in (location.lat, location.lon):
+            coordinates[restaurant.id] = (location.lat, location.lon)
+
+    if _restaurant_index is None or _restaurant_index.coordinates != coordinates:
+        _restaurant_index = RestaurantIndex(coordinates)
+    return _restaurant_index
+
+
+def get_nearest_restaurant_ids(address, restaurant_ids):
+    """Return the given restaurants nearest to the address first.
+
+    Restaurants whose distance is unknown are left out.
+    """
+    restaurants = list(Restaurant.objects.all())
+    locations = get_stored_locations([address] + [restaurant.address for restaurant in restaurants])
+    location = locations[address]
+    if not restaurant_ids or None in (location.lat, location.lon):
+        return []
+    restaurant_index = get_restaurant_index(restaurants, locations)
+    nearest_restaurants = restaurant_index.nearest(
+        location.lat,
+        location.lon,
+        k=len(restaurant_ids),
+        restaurant_ids=set(restaurant_ids),
+    )
+    return [restaurant_id for restaurant_id, distance in nearest_restaurants]
@@ -1,3 +1,61 @@
+import requests
 from django.test import TestCase
 
-# Create your tests here.
+from coordinatesapp.models import GeocodingJob, Location
+from foodcartapp.models import Order, Restaurant
+from restaurateur.helper_functions import (
+    _cached_locations,
+    enqueue_stale_addresses,
+    get_stored_locations,
+    process_geocoding_jobs,
+)
+
+
+def find_coordinates(apikey, address):
+    return "37.6", "55.75"
+
+
+def fail_to_geocode(apikey, address):
+    raise requests.ConnectionError("Геокодер недоступен")
+
+
+class GeocodingQueueTest(TestCase):
+    def setUp(self):
+        _cached_locations.clear()
+
+    def test_worker_stores_coordinates(self):
+        GeocodingJob.objects.enqueue(["Москва, Тверская 1"])
+        self.assertEqual(process_geocoding_jobs(10, geocoder=find_coordinates), 1)
+
+        location = Location.objects.get(address="Москва, Тверская 1")
+        self.assertEqual((location.lat, location.lon, location.fetch_status), (55.75, 37.6, "found"))
+        self.assertFalse(GeocodingJob.objects.exists())
+
+    def test_worker_retries_failed_addresses(self):
+        GeocodingJob.objects.enqueue(["Москва, Тверская 1"])
+        with self.assertLogs(level="WARNING"):
+            process_geocoding_jobs(10, geocoder=fail_to_geocode)
+
+        job = GeocodingJob.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(process_geocoding_jobs(10, geocoder=find_coordinates), 0)
+        self.assertEqual(Location.objects.get(address=job.address).fetch_status, "failed")
+
+    def test_dashboard_reads_locations_without_writing(self):
+        with self.assertNumQueries(1):
+            locations = get_stored_locations(["Москва, Тверская 1"])
+        self.assertIsNone(locations["Москва, Тверская 1"].lat)
+        self.assertFalse(GeocodingJob.objects.exists())
+
+    def test_stale_addresses_are_queued(self):
+        Restaurant.objects.create(name="Star Burger", address="Москва, Тверская 1")
+        Order.objects.create(firstname="Иван", lastname="Петров", phonenumber="+79291234567", address="Москва, Арбат 2")
+        GeocodingJob.objects.all().delete()
+
+        self.assertEqual(enqueue_stale_addresses(), 2)
+        self.assertEqual(
+            set(GeocodingJob.objects.values_list("address", flat=True)),
+            {"Москва, Тверская 1", "Москва, Арбат 2"},
+        )
+        process_geocoding_jobs(10, geocoder=find_coordinates)
+        self.assertEqual(enqueue_stale_addresses(), 0)
@@ -1,13 +1,26 @@
+from datetime import datetime, timedelta
+
+import numpy as np
 from django import forms
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import user_passes_test
+from django.core import signing
+from django.http import JsonResponse
 from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
+from django.utils import timezone
 from django.views import View
 
-from foodcartapp.models import Product, Restaurant, Order, RestaurantMenuItem
-from restaurateur.helper_functions import get_location, calculate_distance
+from foodcartapp.models import ORDER_STATUS_RANKS, Product, Restaurant, Order
+from restaurateur.helper_functions import calculate_distances, get_stored_locations
+from star_burger.db_routers import read_from_replica
+
+
+ORDERS_PAGE_SIZE = 50
+ORDER_FEED_BATCH_SIZE = 100
+ORDER_FEED_SETTLE_TIME = timedelta(seconds=1)
 
 
 class Login(forms.Form):
@@ -27,6 +40,69 @@ class Login(forms.Form):
     )
 
 
+class OrderFilterForm(forms.Form):
+    q = forms.CharField(
+        label='Поиск', required=False, max_length=100,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Имя, телефон или адрес'})
+    )
+    status = forms.ChoiceField(
+        label='Статус', required=False,
+        choices=[('', 'Все')] + Order.ORDER_STATUS[:-1],
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    payment_method = forms.ChoiceField(
+        label='Оплата', required=False,
+        choices=[('', 'Все')] + Order.PAYMENT_METHODS,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    restaurant = forms.ModelChoiceField(
+        label='Готовит', required=False,
+        queryset=Restaurant.objects.order_by('name'),
+        empty_label='Все',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    created_from = forms.DateTimeField(
+        label='Создан с', required=False,
+        widget=forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'})
+    )
+    created_to = forms.DateTimeField(
+        label='Создан по', required=False,
+        widget=forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'})
+    )
+    min_total_price = forms.DecimalField(
+        label='Сумма от', required=False, min_value=0,
+        widget=forms.NumberInput(attrs={'class': 'form-control'})
+    )
+    max_total_price = forms.DecimalField(
+        label='Сумма до', required=False, min_value=0,
+        widget=forms.NumberInput(attrs={'class': 'form-control'})
+    )
+    after = forms.RegexField(regex=r'^\d+-\d+$', required=False, widget=forms.HiddenInput)
+
+    def filter(self, orders):
+        filters = self.cleaned_data
+        if filters['q']:
+            orders = orders.search(filters['q'])
+        if filters['status']:
+            orders = orders.filter(status_rank=ORDER_STATUS_RANKS[filters['status']])
+        if filters['payment_method']:
+            orders = orders.filter(payment_method=filters['payment_method'])
+        if filters['restaurant']:
+            orders = orders.filter(cooked_by=filters['restaurant'])
+        if filters['created_from']:
+            orders = orders.filter(created_at__gte=filters['created_from'])
+        if filters['created_to']:
+            orders = orders.filter(created_at__lte=filters['created_to'])
+        if filters['min_total_price'] is not None:
+            orders = orders.filter(total_price__gte=filters['min_total_price'])
+        if filters['max_total_price'] is not None:
+            orders = orders.filter(total_price__lte=filters['max_total_price'])
+        if filters['after']:
+            status_rank, order_id = map(int, filters['after'].split('-'))
+            orders = orders.after(status_rank, order_id)
+        return orders
+
+
 class LoginView(View):
     def get(self, request, *args, **kwargs):
         form = Login()
@@ -63,6 +139,7 @@ def is_manager(user):
 
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
+@read_from_replica
 def view_products(request):
     restaurants = list(Restaurant.objects.order_by('name'))
     products = list(Product.objects.prefetch_related('menu_items'))
@@ -83,38 +160,37 @@ def view_products(request):
 
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
+@read_from_replica
 def view_restaurants(request):
     return render(request, template_name="restaurants_list.html", context={
         'restaurants': Restaurant.objects.all(),
     })
 
 
-@user_passes_test(is_manager, login_url='restaurateur:login')
-def view_orders(request):
-    orders = Order.objects.exclude(status="delivered").prefetch_related(
-        "contents"
-    ).with_total_price().ordered_by_status_and_id()
-    menu_items = RestaurantMenuItem.objects.prefetch_related("product")
-
-    restaurant_contents = {}
-    for restaurant in menu_items.values_list("restaurant", flat=True).distinct():
-        restaurant_contents[restaurant] = [
-            menu_item.product.id for menu_item in menu_items.filter(restaurant=restaurant)
-        ]
-    for order in orders:
-        available_restaurants = []
-        for restaurant in restaurant_contents:
-            order_availability = [
-                product in restaurant_contents[restaurant]
-                for product in order.contents.values_list("product", flat=True)
-            ]
-            if all(order_availability):
-                available_restaurants.append(restaurant)
-        order.available_restaurants.set(available_restaurants)
+def serialize_orders(orders):
+    restaurants = list(Restaurant.objects.all())
+    locations = get_stored_locations(
+        [order.address for order in orders] + [restaurant.address for restaurant in restaurants]
+    )
+    distances = calculate_distances(
+        [locations[order.address] for order in orders],
+        [locations[restaurant.address] for restaurant in restaurants],
+    )
+    unknown_distances = np.ma.getmaskarray(distances)
+    restaurant_columns = {restaurant.id: column for column, restaurant in enumerate(restaurants)}
 
     serialized_orders = []
-    for order in orders:
-        order_location = get_location(order.address)
+    for row, order in enumerate(orders):
+        eligible_restaurants = list(order.available_restaurants.all())
+        columns = [restaurant_columns[restaurant.id] for restaurant in eligible_restaurants]
+        available_restaurants = []
+        # Masked distances are sorted last, so restaurants with unknown distance follow the ranked ones
+        for position in np.ma.argsort(distances[row, columns]) if columns else []:
+            column = columns[position]
+            available_restaurants.append({
+                "restaurant": eligible_restaurants[position],
+                "distance": None if unknown_distances[row, column] else float(distances[row, column]),
+            })
 
         serialized_orders.append({
             "id": order.id,
@@ -127,13 +203,93 @@ def view_orders(request):
             "status": order.get_status_display(),
             "comments": order.comments,
             "payment_method": order.get_payment_method_display(),
-            "available_restaurants": [{
-                "restaurant": restaurant,
-                "distance": calculate_distance(get_location(restaurant.address), order_location)
-            } for restaurant in order.available_restaurants.all()],
-            "cooked_by": order.cooked_by
+            "available_restaurants": available_restaurants,
+            "cooked_by": order.cooked_by,
         })
 
+    return serialized_orders
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_orders(request):
+    feed_started_at = timezone.now() - ORDER_FEED_SETTLE_TIME
+    filter_form = OrderFilterForm(request.GET)
+    orders = Order.objects.open()
+    if filter_form.is_valid():
+        orders = filter_form.filter(orders)
+    orders = list(
+        orders.select_related("cooked_by").prefetch_related(
+            "available_restaurants"
+        ).ordered_by_status_and_id()[:ORDERS_PAGE_SIZE + 1]
+    )
+    next_page_link = None
+    if len(orders) > ORDERS_PAGE_SIZE:
+        orders = orders[:ORDERS_PAGE_SIZE]
+        next_page_params = request.GET.copy()
+        next_page_params["after"] = f"{orders[-1].status_rank}-{orders[-1].id}"
+        next_page_link = f"?{next_page_params.urlencode()}"
+
+    filter_params = request.GET.copy()
+    filter_params.pop("after", None)
     return render(request, template_name='order_items.html', context={
-        "order_items": serialized_orders
+        "order_items": serialize_orders(orders),
+        "filter_form": filter_form,
+        "next_page_link": next_page_link,
+        "return_url": request.get_full_path(),
+        "feed_url": f"{reverse('restaurateur:order_feed')}?{filter_params.urlencode()}",
+        "feed_cursor": dump_feed_cursor(feed_started_at, 0),
+    })
+
+
+def dump_feed_cursor(updated_at, order_id):
+    return signing.dumps([updated_at.isoformat(), order_id], salt="order-feed")
+
+
+def load_feed_cursor(cursor):
+    updated_at, order_id = signing.loads(cursor, salt="order-feed")
+    return datetime.fromisoformat(updated_at), order_id
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def order_feed(request):
+    try:
+        updated_at, order_id = load_feed_cursor(request.GET.get("cursor", ""))
+    except (signing.BadSignature, ValueError, TypeError):
+        return JsonResponse({"error": "invalid cursor"}, status=400)
+
+    filter_params = request.GET.copy()
+    for param in ("cursor", "after"):
+        filter_params.pop(param, None)
+    filter_form = OrderFilterForm(filter_params)
+    visible_orders = Order.objects.open()
+    if filter_form.is_valid():
+        visible_orders = filter_form.filter(visible_orders)
+
+    settled_at = timezone.now() - ORDER_FEED_SETTLE_TIME
+    changed_orders = list(
+        Order.objects.changed_after(updated_at, order_id)
+        .filter(updated_at__lte=settled_at)
+        .select_related("cooked_by")
+        .prefetch_related("available_restaurants")
+        .order_by("updated_at", "id")[:ORDER_FEED_BATCH_SIZE]
+    )
+
+    next_cursor = request.GET["cursor"]
+    if changed_orders:
+        next_cursor = dump_feed_cursor(changed_orders[-1].updated_at, changed_orders[-1].id)
+
+    visible_ids = set(
+        visible_orders.filter(id__in=[order.id for order in changed_orders]).values_list("id", flat=True)
+    )
+    return_url = f"{reverse('restaurateur:view_orders')}?{filter_params.urlencode()}"
+    return JsonResponse({
+        "cursor": next_cursor,
+        "orders": [{
+            "id": serialized_order["id"],
+            "visible": serialized_order["id"] in visible_ids,
+            "html": render_to_string("order_row.html", {
+                "item": serialized_order,
+                "return_url": return_url,
+            }, request=request),
+        } for serialized_order in serialize_orders(changed_orders)],
     })
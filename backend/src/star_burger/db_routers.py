@@ -0,0 +1,135 @@
+import functools
+import logging
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic, time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_DATABASE = "default"
+PRIMARY_PIN_COOKIE = "db_primary_until"
+REPLICA_ONLY_MODELS = {
+    "foodcartapp.archivedorder",
+    "foodcartapp.archivedordercontents",
+}
+POSTGRES_REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+_replica_reads = ContextVar("replica_reads", default=False)
+_primary_pinned = ContextVar("primary_pinned", default=False)
+_replica_health = {}
+
+
+def get_replica_lag(alias):
+    """Return how many seconds the replica is behind the primary."""
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRES_REPLICA_LAG_SQL)
+        lag, = cursor.fetchone()
+    return float(lag or 0)
+
+
+def is_replica_healthy(alias):
+    checked_at, healthy = _replica_health.get(alias, (None, False))
+    if checked_at is not None and monotonic() - checked_at < settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL:
+        return healthy
+    try:
+        lag = get_replica_lag(alias)
+    except DatabaseError:
+        logger.exception("Реплика %s недоступна, чтение идёт с основной базы", alias)
+        healthy = False
+    else:
+        healthy = lag <= settings.DATABASE_REPLICA_MAX_LAG
+        if not healthy:
+            logger.warning("Реплика %s отстаёт на %.1f с, чтение идёт с основной базы", alias, lag)
+    _replica_health[alias] = (monotonic(), healthy)
+    return healthy
+
+
+def choose_replica():
+    replicas = [alias for alias in settings.DATABASE_REPLICAS if is_replica_healthy(alias)]
+    if not replicas:
+        return PRIMARY_DATABASE
+    return random.choice(replicas)
+
+
+def read_from_replica(view):
+    """Serve the view's reads from a replica unless the request is pinned to the primary."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _replica_reads.set(True)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
+
+
+@contextmanager
+def use_primary():
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or _primary_pinned.get():
+            return PRIMARY_DATABASE
+        if _replica_reads.get() or model._meta.label_lower in REPLICA_ONLY_MODELS:
+            return choose_replica()
+        return PRIMARY_DATABASE
+
+    def db_for_write(self, model, **hints):
+        _primary_pinned.set(True)
+        return PRIMARY_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
+
+
+class PrimaryPinningMiddleware:
+    """Keep reads on the primary for a while after a client has written something.
+
+    Unsafe requests set a cookie, so the page the client is redirected to after
+    saving a form is read from the primary and shows the change.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PRIMARY_PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        token = _primary_pinned.set(pinned_until > time())
+        try:
+            response = self.get_response(request)
+        finally:
+            _primary_pinned.reset(token)
+        if settings.DATABASE_REPLICAS and request.method not in ("GET", "HEAD", "OPTIONS"):
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE,
+                str(time() + settings.DATABASE_PRIMARY_PIN_SECONDS),
+                max_age=settings.DATABASE_PRIMARY_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
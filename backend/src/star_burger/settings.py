@@ -1,4 +1,6 @@
 import os
+import tempfile
+from datetime import timedelta
 
 import dj_database_url
 
@@ -36,6 +38,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'star_burger.db_routers.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -95,6 +98,24 @@ DATABASES = {
         )
     )
 }
+DATABASE_REPLICAS = []
+for replica_number, replica_url in enumerate(env.list('DB_REPLICA_URLS', []), start=1):
+    DATABASES[f'replica_{replica_number}'] = {
+        **dj_database_url.parse(replica_url),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{replica_number}')
+DATABASE_ROUTERS = ['star_burger.db_routers.ReplicaRouter']
+DATABASE_REPLICA_MAX_LAG = env.float('DB_REPLICA_MAX_LAG', 5)
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = env.float('DB_REPLICA_LAG_CHECK_INTERVAL', 5)
+DATABASE_PRIMARY_PIN_SECONDS = env.int('DB_PRIMARY_PIN_SECONDS', 10)
+
+CACHES = {
+    'default': env.dj_cache_url(
+        'CACHE_URL',
+        'file://{0}'.format(os.path.join(tempfile.gettempdir(), 'star_burger_cache'))
+    )
+}
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -135,8 +156,54 @@ STATICFILES_DIRS = [
 
 PHONENUMBER_DEFAULT_REGION = "RU"
 
+IDEMPOTENCY_KEY_TTL = timedelta(seconds=env.int("IDEMPOTENCY_KEY_TTL", 60 * 60 * 24))
+IDEMPOTENCY_LOCK_TIMEOUT = timedelta(seconds=env.int("IDEMPOTENCY_LOCK_TIMEOUT", 60))
+IDEMPOTENCY_WAIT_TIMEOUT = env.float("IDEMPOTENCY_WAIT_TIMEOUT", 10)
+
+ORDER_INTAKE_MODE = env.str("ORDER_INTAKE_MODE", "direct", validate=lambda mode: mode in ("direct", "write_behind"))
+ORDER_INTAKE_LOG_PATH = env.str("ORDER_INTAKE_LOG_PATH", os.path.join(BASE_DIR, "order_intake.sqlite3"))
+ORDER_INTAKE_LOG_TIMEOUT = env.float("ORDER_INTAKE_LOG_TIMEOUT", 5)
+ORDER_INTAKE_LOG_RETENTION = timedelta(seconds=env.int("ORDER_INTAKE_LOG_RETENTION", 60 * 60 * 24 * 7))
+
+ORDER_ADMISSION_ENABLED = env.bool("ORDER_ADMISSION_ENABLED", True)
+ORDER_ADMISSION_STORE_PATH = env.str("ORDER_ADMISSION_STORE_PATH", os.path.join(BASE_DIR, "order_admission.sqlite3"))
+ORDER_ADMISSION_STORE_TIMEOUT = env.float("ORDER_ADMISSION_STORE_TIMEOUT", 0.2)
+ORDER_ADMISSION_IP_HEADER = env.str("ORDER_ADMISSION_IP_HEADER", None)
+ORDER_ADMISSION_RATE = env.float("ORDER_ADMISSION_RATE", 30)
+ORDER_ADMISSION_BURST = env.float("ORDER_ADMISSION_BURST", 60)
+ORDER_ADMISSION_IP_RATE = env.float("ORDER_ADMISSION_IP_RATE", 0.2)
+ORDER_ADMISSION_IP_BURST = env.float("ORDER_ADMISSION_IP_BURST", 5)
+ORDER_ADMISSION_PARTNER_RATE = env.float("ORDER_ADMISSION_PARTNER_RATE", 10)
+ORDER_ADMISSION_PARTNER_BURST = env.float("ORDER_ADMISSION_PARTNER_BURST", 500)
+
+PARTNER_API_KEYS = env.list("PARTNER_API_KEYS", [])
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "foodcartapp.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
 YANDEX_API_KEY = env.str("YANDEX_API_KEY")
 
+GEOCODER_CACHE_TTL = {
+    "found": timedelta(seconds=env.int("GEOCODER_FOUND_TTL", 60 * 60 * 24 * 30)),
+    "not_found": timedelta(seconds=env.int("GEOCODER_NOT_FOUND_TTL", 60 * 60 * 24)),
+    "failed": timedelta(seconds=env.int("GEOCODER_FAILED_TTL", 60 * 10)),
+}
+GEOCODER_LRU_SIZE = env.int("GEOCODER_LRU_SIZE", 1024)
+GEOCODER_MAX_WORKERS = env.int("GEOCODER_MAX_WORKERS", 4)
+GEOCODER_MAX_ATTEMPTS = env.int("GEOCODER_MAX_ATTEMPTS", 5)
+GEOCODER_JOB_LEASE = timedelta(seconds=env.int("GEOCODER_JOB_LEASE", 60 * 5))
+GEOCODER_TIMEOUT = env.float("GEOCODER_TIMEOUT", 3)
+GEOCODER_MIN_TIMEOUT = env.float("GEOCODER_MIN_TIMEOUT", 0.5)
+GEOCODER_DEADLINE = env.float("GEOCODER_DEADLINE", 6)
+GEOCODER_MAX_RETRIES = env.int("GEOCODER_MAX_RETRIES", 3)
+GEOCODER_BACKOFF = env.float("GEOCODER_BACKOFF", 0.5)
+GEOCODER_CIRCUIT_THRESHOLD = env.int("GEOCODER_CIRCUIT_THRESHOLD", 5)
+GEOCODER_CIRCUIT_RESET_TIMEOUT = env.float("GEOCODER_CIRCUIT_RESET_TIMEOUT", 30)
+
 rollbar_token = env.str("ROLLBAR_TOKEN", None)
 if rollbar_token:
     ROLLBAR = {
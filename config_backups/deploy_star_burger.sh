@@ -23,6 +23,8 @@ npm ci --force
 
 python manage.py migrate
 
+python manage.py add_default_banners
+
 python manage.py collectstatic --noinput
 
 ./node_modules/.bin/parcel build bundles-src/index.js --dist-dir bundles --public-url="./"
@@ -13,6 +13,13 @@ import NoResults from "./components/NoResults";
 
 import './css/App.css';
 
+function generateIdempotencyKey(){
+  if (window.crypto && window.crypto.randomUUID){
+    return window.crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+}
+
 class App extends Component {
 
   constructor(props){
@@ -62,6 +69,11 @@ class App extends Component {
 
     let csrfToken = document.querySelector("[name=csrfmiddlewaretoken]").value;
 
+    // Keep the key until the server answers, so a retry after a network error doesn't create a second order
+    if (!this.checkoutIdempotencyKey){
+      this.checkoutIdempotencyKey = generateIdempotencyKey();
+    }
+
     try {
       let response = await fetch(url, {
         method: 'post',
@@ -69,9 +81,11 @@ class App extends Component {
           'Accept': 'application/json',
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken,
+          'Idempotency-Key': this.checkoutIdempotencyKey,
         },
         body: JSON.stringify(data),
       });
+      this.checkoutIdempotencyKey = null;
 
       if (!response.ok){
         alert('Ошибка при оформлении заказа. Попробуйте ещё раз или свяжитесь с нами по телефону.');